@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+"""
+Benchmark loading rows into AllForms
+
+Compares one INSERT per row against the batched _add_form pipeline
+"""
+
+import argparse
+import random
+import time
+
+from enwiktionary_wordlist.all_forms import AllForms
+
+def make_rows(count):
+    random.seed(0)
+    rows = []
+    while len(rows) < count:
+        lemma = "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(random.randint(3,10)))
+        pos = random.choice(["n", "v", "adj"])
+        for suffix in ["", "s", "a", "as", "os"]:
+            rows.append((lemma + suffix, pos, lemma))
+        # duplicates are common when forms are declared by several words
+        rows.append((lemma + "s", pos, lemma))
+    return rows[:count]
+
+def load_per_row(rows):
+    allforms = AllForms()
+    allforms.dbcon.execute("BEGIN TRANSACTION;")
+    for row in rows:
+        allforms.dbcon.execute("INSERT OR IGNORE INTO forms VALUES (?, ?, ?)", row)
+    allforms.dbcon.execute("COMMIT;")
+
+def load_batched(rows):
+    allforms = AllForms()
+    allforms.dbcon.execute("BEGIN TRANSACTION;")
+    for row in rows:
+        allforms._add_form(*row)
+    allforms._flush_forms()
+    allforms.dbcon.execute("COMMIT;")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AllForms row loading")
+    parser.add_argument("--rows", help="number of rows to load", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    for name, func in [("per row", load_per_row), ("batched", load_batched)]:
+        start = time.perf_counter()
+        func(rows)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<8} {len(rows)/elapsed:>12,.0f} rows/second")
+
+if __name__ == "__main__":
+    main()
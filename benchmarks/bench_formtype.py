@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+"""
+Benchmark KaikkiToWordlist.get_formtype
+
+Compares building the regexes for every call against the precompiled patterns
+with the " of " prefilter, on synthetic Kaikki glosses
+"""
+
+import argparse
+import random
+import re
+import time
+
+from enwiktionary_wordlist.kaikki_to_wordlist import KaikkiToWordlist
+
+def make_glosses(count):
+    random.seed(0)
+    glosses = []
+    while len(glosses) < count:
+        word = "".join(random.choice("abcdefghijklmnopqrstuvwxyzñáé") for _ in range(random.randint(3,12)))
+        x = random.random()
+        if x < .3:
+            glosses.append(f"{random.choice(['plural', 'feminine plural', 'Feminine singular', 'female equivalent'])} of {word}")
+        elif x < .35:
+            glosses.append(f"infinitive of {word} combined with {random.choice(['me', 'te', 'se'])}")
+        elif x < .4:
+            glosses.append(f"inflection of {word}:\n## first-person singular present indicative")
+        elif x < .45:
+            glosses.append(f"a kind of {word}")
+        else:
+            glosses.append(f"{word}, {word}s (a definition with no form information)")
+    return glosses
+
+def get_formtype_uncompiled(gloss):
+    cls = KaikkiToWordlist
+
+    match = re.match(f"({cls.RE_FORMTYPE}) of (.*?) combined with (.*)", gloss, re.IGNORECASE)
+    if match:
+        return f"{match.group(1)} combined with {match.group(3)}", match.group(2)
+
+    match = re.match(f"({cls.RE_FORMTYPE})+ of (.*)", gloss, re.IGNORECASE)
+    if match:
+        return match.group(1), match.group(2)
+
+    match = re.match("inflection of (.*?):\n##.*", gloss, re.IGNORECASE)
+    if match:
+        return "smart_inflection", match.group(1)
+
+    return None, None
+
+def run(name, func, glosses):
+    start = time.perf_counter()
+    res = [func(gloss) for gloss in glosses]
+    elapsed = time.perf_counter() - start
+    print(f"{name:<11} {len(glosses)/elapsed:>12,.0f} glosses/second")
+    return res
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KaikkiToWordlist.get_formtype")
+    parser.add_argument("--glosses", help="number of glosses to match", type=int, default=200_000)
+    args = parser.parse_args()
+
+    glosses = make_glosses(args.glosses)
+    expected = run("uncompiled", get_formtype_uncompiled, glosses)
+    res = run("compiled", KaikkiToWordlist.get_formtype, glosses)
+    assert res == expected
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+"""
+Benchmark loading a Kaikki JSONL file with KaikkiToWordlist
+
+Compares reading the file twice (load_forms, then load_lemmas) against the single pass load(),
+optionally with worker processes, on a synthetic file
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from enwiktionary_wordlist.kaikki_to_wordlist import KaikkiToWordlist
+
+def make_extra(word):
+    """ Fields that aren't used by KaikkiToWordlist, real entries are mostly made of these """
+    return {
+        "lang": "Spanish",
+        "lang_code": "es",
+        "sounds": [{"ipa": f"/{word}/", "tags": ["Castilian"]}, {"ipa": f"/{word}/", "tags": ["Latin-America"]}],
+        "categories": [f"Spanish category {i}" for i in range(10)],
+        "translations": [{"code": f"l{i}", "lang": f"Language {i}", "word": f"{word}{i}"} for i in range(15)],
+    }
+
+def make_entries(count):
+    random.seed(0)
+    entries = []
+    while len(entries) < count:
+        lemma = "".join(random.choice("abcdefghijklmnopqrstuvwxyzñáé") for _ in range(random.randint(3,12)))
+        forms = [lemma + "s", lemma + "a", lemma + "as"]
+        entries.append({
+            **make_extra(lemma),
+            "word": lemma,
+            "pos": "noun",
+            "forms": [{"form": form, "tags": ["plural"]} for form in forms],
+            "head_templates": [{"expansion": f"{lemma} m (plural {forms[0]})"}],
+            "etymology_text": f"From Latin {lemma}us.",
+            "senses": [{"glosses": [f"a definition of {lemma}"], "raw_glosses": [f"a definition of {lemma}"],
+                "examples": [{"text": f"un {lemma}", "english": f"a {lemma}"}]}],
+        })
+        for form in forms:
+            # most forms are generated, some have extra senses
+            senses = [{"glosses": [f"plural of {lemma}"], "raw_glosses": [f"plural of {lemma}"]}]
+            if random.random() < .05:
+                senses.append({"glosses": [f"another meaning of {form}"], "raw_glosses": [f"another meaning of {form}"]})
+            entries.append({"word": form, "pos": "noun", "senses": senses, **make_extra(form)})
+    return entries[:count]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KaikkiToWordlist loading")
+    parser.add_argument("--entries", help="number of entries in the test file", type=int, default=200_000)
+    parser.add_argument("-j", help="also benchmark a single pass load with N workers", type=int)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "kaikki.jsonl")
+        with open(filename, "w") as outfile:
+            for entry in make_entries(args.entries):
+                outfile.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        results = []
+        runs = [("two pass", False, None), ("one pass", True, None)]
+        if args.j:
+            runs.append((f"{args.j} jobs", True, args.j))
+
+        for name, single_pass, workers in runs:
+            start = time.perf_counter()
+            converter = KaikkiToWordlist(filename, single_pass=single_pass, workers=workers)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<9} {args.entries/elapsed:>12,.0f} entries/second")
+            results.append((converter.all_forms, {k:dict(v) for k,v in converter.all_lemmas.items()}))
+
+        assert all(res == results[0] for res in results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+
+"""
+Benchmark parsing of mbformat wordlist lines
+
+Compares the regex-only parser against Wordlist.parse_line on a synthetic file
+"""
+
+import argparse
+import random
+import re
+import time
+
+from enwiktionary_wordlist.wordlist import Wordlist
+
+def make_lines(count):
+    random.seed(0)
+    lines = []
+    while len(lines) < count:
+        word = "".join(random.choice("abcdefghijklmnopqrstuvwxyzñáé") for _ in range(random.randint(3,12)))
+        lines.append(f"{word} {{n-meta}} :: {{{{es-noun|m}}}}\n")
+        lines.append(f"{word} {{n-forms}} :: pl={word}s\n")
+        for _ in range(random.randint(1,4)):
+            if random.random() < .1:
+                lines.append(f"{word} {{m}} [colloquial] | syn1; syn2 :: a definition of {word}\n")
+            else:
+                lines.append(f"{word} {{m}} :: a definition of {word}\n")
+    return lines[:count]
+
+def parse_line_regex(line):
+    res = re.match(Wordlist._mbformat_pattern.pattern, line)
+    word = res.group('word').strip()
+    pos = res.group('pos') if res.group('pos') else ''
+    note = res.group('note') if res.group('note') else ''
+    syn = res.group('syn') if res.group('syn') else ''
+    definition = res.group('def') if res.group('def') else ''
+    return (word, pos, note, syn, definition)
+
+def run(name, func, lines):
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(lines)/elapsed:>12,.0f} lines/second")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mbformat line parsing")
+    parser.add_argument("--lines", help="number of lines to generate", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines)
+    assert all(parse_line_regex(line) == Wordlist.parse_line(line) for line in lines)
+
+    run("regex", parse_line_regex, lines)
+    run("parse_line", Wordlist.parse_line, lines)
+
+if __name__ == "__main__":
+    main()
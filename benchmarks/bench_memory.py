@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+
+"""
+Report the memory used per Word and Sense object
+
+Parses a wordlist (or a generated sample based on the test fixtures) and
+measures the memory allocated by the Word and Sense objects with tracemalloc
+"""
+
+import argparse
+import tracemalloc
+
+from enwiktionary_wordlist.wordlist import Wordlist
+
+SAMPLE = """\
+_____
+{word}
+pos: n
+  meta: {{{{head|es|noun|plural|{word}s|g=m}}}}
+  g: m
+  gloss: protector
+    q: rare
+    syn: syn1; syn2
+    ex: una frase de ejemplo
+      eng: an example sentence
+  gloss: female equivalent of "{word}a"
+pos: v
+  meta: {{{{es-verb}}}}
+  gloss: to protect
+  gloss: alternative form of "{word}ar"
+"""
+
+def make_sample(count):
+    for i in range(count):
+        yield from SAMPLE.format(word=f"word{i}").splitlines()
+
+def measure(func):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    res = func()
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return res, used
+
+def main():
+    parser = argparse.ArgumentParser(description="Report memory used by Word and Sense objects")
+    parser.add_argument("wordlist", help="wordlist file (default: generated sample)", nargs="?")
+    parser.add_argument("--count", help="number of sample entries to generate", type=int, default=20000)
+    args = parser.parse_args()
+
+    if args.wordlist:
+        with open(args.wordlist) as infile:
+            wordlist = Wordlist(infile, cache_words=False)
+    else:
+        wordlist = Wordlist(make_sample(args.count), cache_words=False)
+
+    titles = list(wordlist.all_entries)
+
+    words, used = measure(lambda: [w for title in titles for w in wordlist.get_words(title)])
+    print(f"Word:  {used/len(words):8.1f} bytes per object ({len(words)} words)")
+
+    senses, used = measure(lambda: [s for w in words for s in w.senses])
+    print(f"Sense: {used/len(senses):8.1f} bytes per object ({len(senses)} senses, including examples)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+"""
+Benchmark Sense construction for glosses with many examples and subsenses
+
+The time per item should stay flat as the number of examples grows
+"""
+
+import argparse
+import time
+
+from enwiktionary_wordlist.sense import Sense
+
+def make_sense_data(examples):
+    data = [("gloss", "to do"), ("q", "transitive")]
+    for i in range(examples):
+        data.append(("ex", f"example {i}"))
+        data.append(("eng", f"translation {i}"))
+        if i % 10 == 0:
+            data.append(("_gloss", f"subsense {i}"))
+            data.append(("ex", f"subsense example {i}"))
+            data.append(("src", f"source {i}"))
+    data.append(("syn", "hacer; realizar"))
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Sense construction")
+    parser.add_argument("--repeat", help="number of senses to build for each size", type=int, default=200)
+    args = parser.parse_args()
+
+    for examples in [10, 100, 500, 2000]:
+        data = make_sense_data(examples)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            Sense(data)
+        elapsed = time.perf_counter() - start
+        print(f"{examples:>5} examples: {elapsed/args.repeat*1000:8.3f} ms per sense, {elapsed/args.repeat/len(data)*1e6:6.3f} us per item")
+
+if __name__ == "__main__":
+    main()
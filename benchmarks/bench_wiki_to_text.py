@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+
+"""
+Benchmark wiki_to_text over every gloss in the test wordlists
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+
+from enwiktionary_wordlist.utils import wiki_to_text
+
+def get_glosses():
+    glosses = []
+    pattern = os.path.join(os.path.dirname(__file__), "..", "tests", "*.py")
+    for filename in glob.glob(pattern):
+        with open(filename) as infile:
+            for line in infile:
+                match = re.search(r"(?:gloss: |:: )(.*)", line)
+                if match:
+                    glosses.append(match.group(1))
+    return glosses
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wiki_to_text")
+    parser.add_argument("--repeat", help="number of passes over the glosses", type=int, default=20)
+    args = parser.parse_args()
+
+    glosses = get_glosses()
+    plain = [g for g in glosses if not any(c in g for c in "{[<'&")]
+    print(f"{len(glosses)} glosses, {len(plain)} without markup")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for gloss in glosses:
+            wiki_to_text(gloss, "test")
+    elapsed = time.perf_counter() - start
+    print(f"{len(glosses)*args.repeat/elapsed:,.0f} calls/second")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+"""
+Benchmark opening a wordlist with the mmap backend
+
+Compares the dict backend and a serial mmap scan against a scan split across
+worker processes, on a synthetic wordlist. The saved offset index isn't used,
+so every run scans the file
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from enwiktionary_wordlist.mmap_entries import MmapEntries
+from enwiktionary_wordlist.wordlist import Wordlist
+
+SAMPLE = """\
+_____
+{word}
+pos: n
+  meta: {{{{es-noun|m}}}}
+  g: m
+  gloss: protector
+    q: rare
+    ex: una frase de ejemplo
+      eng: an example sentence
+  gloss: female equivalent of "{word}a"
+pos: v
+  meta: {{{{es-verb}}}}
+  gloss: to protect
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mmap wordlist scanning")
+    parser.add_argument("--count", help="number of entries in the test file", type=int, default=200_000)
+    parser.add_argument("-j", help="number of worker processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "wordlist.txt")
+        with open(filename, "w") as outfile:
+            for i in range(args.count):
+                outfile.write(SAMPLE.format(word=f"word{i}"))
+
+        start = time.perf_counter()
+        Wordlist.from_file(filename, backend="dict")
+        print(f"dict backend   {time.perf_counter()-start:6.2f}s")
+
+        results = []
+        for name, workers in [("mmap serial", None), (f"mmap {args.j} jobs", args.j)]:
+            start = time.perf_counter()
+            entries = MmapEntries(filename, use_index=False, workers=workers)
+            print(f"{name:<14} {time.perf_counter()-start:6.2f}s")
+            results.append((list(entries._starts), list(entries._ends), list(entries._sorted)))
+
+        assert all(res == results[0] for res in results)
+
+if __name__ == "__main__":
+    main()
@@ -3,138 +3,62 @@
 import argparse
 import collections
 import csv
+import heapq
 import io
+import itertools
 import os
+import pathlib
 import sqlite3
 import sys
+import tempfile
+import threading
+import weakref
 
 from .wordlist import Wordlist
 
-class AllForms:
-    FEM_LEMMAS = ["cabra", "rata"]
-
-    def __init__(self, dbfilename=None):
-
-        if dbfilename:
-            existing = os.path.exists(dbfilename)
-            self.dbcon = sqlite3.connect(dbfilename, check_same_thread=False)
-            self.dbcon.execute('PRAGMA synchronous=OFF;')
-
-            if not existing:
-                self.dbcon.execute('''CREATE TABLE forms (form text, pos text, lemma text, UNIQUE(form,pos,lemma))''')
-        else:
-            self.dbcon = sqlite3.connect(":memory:", check_same_thread=False)
-            self.dbcon.execute('''CREATE TABLE forms (form text, pos text, lemma text, UNIQUE(form,pos,lemma))''')
-
-    def get_lemmas(self, word, filter_pos=None):
-        if filter_pos:
-            if isinstance(filter_pos, list):
-                in_clause = ",".join(["?"]*len(filter_pos))
-                res = self.dbcon.execute(f"SELECT pos || '|' || lemma FROM forms WHERE form=? AND pos IN ({in_clause}) ORDER BY pos, lemma", (word, *filter_pos))
-            else:
-                res = self.dbcon.execute("SELECT pos || '|' || lemma FROM forms WHERE form=? AND pos=? ORDER BY pos, lemma", (word, filter_pos))
-        else:
-            res = self.dbcon.execute("SELECT pos || '|' || lemma FROM forms WHERE form=? ORDER BY pos, lemma", (word,))
-
-        return [x[0] for x in res]
-
-    def get_lemma_forms(self, lemma, filter_pos=None):
-        if filter_pos:
-            res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE lemma=? AND pos=?", (lemma, filter_pos,))
-        else:
-            res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE lemma=?", (lemma,))
-
-        return [x[0] for x in res]
-
-    def has_form(self, form, pos=None):
-        if pos:
-            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? AND pos=? LIMIT 1", (form, pos,))
-        else:
-            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? LIMIT 1", (form,))
-        return bool(list(res))
+class BaseAllForms:
+    """ Form loading and CSV export shared by the allforms backends
+    Subclasses store the rows passed to _add_row and provide the lookup methods """
 
-    def has_lemma(self, lemma, pos=None):
-        if pos:
-            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? and lemma=? AND pos=? LIMIT 1", (lemma, lemma, pos,))
-        else:
-            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? and lemma=? LIMIT 1", (lemma,lemma))
-        return bool(list(res))
-
-    def get_form_pos(self, form):
-        for x in self.dbcon.execute(f"SELECT DISTINCT pos FROM forms WHERE form=?", (form,)):
-            yield x[0]
-
-    @property
-    def all_lemmas(self):
-        for x in self.dbcon.execute("SELECT DISTINCT lemma FROM forms ORDER BY lemma"):
-            yield x[0]
-
-    @property
-    def all_forms(self):
-        for x in self.dbcon.execute("SELECT DISTINCT form FROM forms ORDER BY form"):
-            yield x[0]
+    FEM_LEMMAS = ["cabra", "rata"]
 
-    @property
-    def all(self):
-        return self.dbcon.execute("SELECT form, pos, lemma  FROM forms ORDER BY form, pos, lemma")
+    @classmethod
+    def from_data(cls, allforms_data):
+        self = cls()
+        self._load_data(allforms_data)
+        return self
 
-    def get_all_forms(self, filter_pos):
-        if filter_pos:
-            if isinstance(filter_pos, list):
-                in_clause = ",".join(["?"]*len(filter_pos))
-                res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE pos IN ({in_clause})")
-            else:
-                res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE pos=?", (filter_pos,))
+    @classmethod
+    def from_wordlist(cls, wordlist):
+        self = cls()
 
-        return [x[0] for x in res]
+        self._begin_load()
+        self._load_wordlist_forms(wordlist)
+        self._end_load()
 
-    @classmethod
-    def from_data(cls, allforms_data, dbfilename=None):
-        self = cls(dbfilename)
+        return self
 
-        self.dbcon.execute("BEGIN TRANSACTION;")
+    def _load_data(self, allforms_data):
+        self._begin_load()
 
         cr = csv.reader(allforms_data)
         for form,pos,*lemmas in cr:
             for lemma in lemmas:
                 self._add_form(form, pos, lemma)
 
-        self.dbcon.execute('''CREATE INDEX idx_form_pos ON forms (form, pos)''')
-        self.dbcon.execute('''CREATE INDEX idx_lemma ON forms (lemma)''')
-        self.dbcon.execute("COMMIT;")
-        return self
-
-    @classmethod
-    def from_file(cls, filename, cache_words=True):
-        # check for cached version
-        cached = filename + ".sqlite"
-        if os.path.exists(cached):
-            if os.path.getctime(cached) > os.path.getctime(filename):
-                return cls(cached)
-
-            # delete the old cache
-            os.remove(cached)
+        self._end_load(lemma_index=True)
 
-        with open(filename) as infile:
-            return cls.from_data(infile, cached)
+    def _begin_load(self):
+        pass
 
-    @classmethod
-    def from_wordlist(cls, wordlist):
-        self = cls()
-
-        self.dbcon.execute("BEGIN TRANSACTION;")
-        self._load_wordlist_forms(wordlist)
-        self.dbcon.execute('''CREATE INDEX idx_form_pos ON forms (form, pos)''')
-        self.dbcon.execute("COMMIT;")
-
-        return self
+    def _end_load(self, lemma_index=False):
+        pass
 
     def _load_wordlist_forms(self, wordlist):
+        self._load_words_forms(wordlist.iter_all_words(), wordlist)
 
-        prev_pos = None
-        prev_word = None
-        primary_lemma = True
-        for word in wordlist.iter_all_words():
+    def _load_words_forms(self, words, wordlist):
+        for word in words:
 
             if self.is_lemma(word):
                 self._add_form(word.word, word.pos, word.word)
@@ -249,23 +173,96 @@ class AllForms:
             return
 
         for f in form.split("|"):
-            self.dbcon.execute("INSERT OR IGNORE INTO forms VALUES (?, ?, ?)", [f, pos, lemma])
+            self._add_row(f, pos, lemma)
 
+    def _add_row(self, form, pos, lemma):
+        raise NotImplementedError
 
     @property
     def all_csv(self):
+        return self.iter_rows_csv(self.all)
+
+    def write_csv(self, outfile):
+        """ Writes the allforms CSV to outfile """
+        self.write_rows_csv(outfile, self.all)
+
+    @classmethod
+    def write_rows_csv(cls, outfile, rows):
+        """ Writes allforms CSV lines for the form, pos, lemma rows to outfile
+        rows must be sorted """
+        for line in cls.iter_rows_csv(rows):
+            outfile.write(line)
+            outfile.write("\n")
+
+    @classmethod
+    def iter_rows_csv(cls, rows):
+        """ Yields allforms CSV lines for the form, pos, lemma rows, formatted like make_csv
+        rows must be sorted """
+
+        # a single writer is reused for every line
+        si = io.StringIO()
+        cw = csv.writer(si)
+        lemmas = None
+        for form, pos, lemmas in cls.group_rows(rows):
+            si.seek(0)
+            si.truncate()
+            cw.writerow([form,pos]+sorted(lemmas))
+            yield si.getvalue().strip()
+
+        # without any rows there's still a single line, like make_csv(None, None, [])
+        if lemmas is None:
+            yield cls.make_csv(None, None, [])
+
+    @staticmethod
+    def group_rows(rows):
+        """ Yields form, pos, [lemmas] for sorted form, pos, lemma rows, duplicate rows are skipped """
         lemmas = []
         prev_pos = None
         prev_form = None
-        for form, pos, lemma in self.all:
+        for form, pos, lemma in rows:
             if form != prev_form or pos != prev_pos:
                 if lemmas:
-                    yield self.make_csv(prev_form, prev_pos, lemmas)
+                    yield prev_form, prev_pos, lemmas
                 lemmas = []
+            elif lemmas[-1] == lemma:
+                continue
             lemmas.append(lemma)
             prev_form = form
             prev_pos = pos
-        yield self.make_csv(prev_form, prev_pos, lemmas)
+        if lemmas:
+            yield prev_form, prev_pos, lemmas
+
+    @classmethod
+    def iter_wordlist_rows(cls, wordlist, chunk_size=100000, tmpdir=None):
+        """ Yields the sorted form, pos, lemma rows for all words in wordlist
+
+        The forms of every chunk_size words are sorted in memory and written to a
+        temporary file, the files are then merged so memory use doesn't depend on
+        the size of the wordlist """
+
+        with tempfile.TemporaryDirectory(dir=tmpdir) as tmp:
+            runs = []
+            words = wordlist.iter_all_words()
+            while True:
+                chunk_words = list(itertools.islice(words, chunk_size))
+                if not chunk_words:
+                    break
+
+                chunk = MemoryAllForms()
+                chunk._load_words_forms(chunk_words, wordlist)
+                del chunk_words
+
+                filename = os.path.join(tmp, f"{len(runs)}.csv")
+                with open(filename, "w", newline="") as outfile:
+                    csv.writer(outfile).writerows(chunk.all)
+                runs.append(filename)
+
+            files = [open(filename, newline="") for filename in runs]
+            try:
+                yield from heapq.merge(*(map(tuple, csv.reader(f)) for f in files))
+            finally:
+                for f in files:
+                    f.close()
 
     @staticmethod
     def make_csv(form, pos, lemmas):
@@ -278,3 +275,338 @@ class AllForms:
 #        value = f"{pos}|{lemma}"
 #        if value not in self.all_forms[form]:
 #            self.all_forms[form].append(value)
+
+
+class _ThreadConnection:
+    """ A read-only connection owned by one thread, closed when the owner is garbage collected """
+
+    __slots__ = ("dbcon", "pid", "_finalizer", "__weakref__")
+
+    def __init__(self, dbcon):
+        self.dbcon = dbcon
+        self.pid = os.getpid()
+        self._finalizer = weakref.finalize(self, self._close, dbcon, self.pid)
+
+    def close(self):
+        self._finalizer()
+
+    @staticmethod
+    def _close(dbcon, pid):
+        # connections inherited by forked processes belong to the parent
+        if pid == os.getpid():
+            dbcon.close()
+
+class AllForms(BaseAllForms):
+    # number of rows collected by _add_form before they're written to the database
+    BATCH_SIZE = 50000
+
+    # maximum number of parameters in a query, older SQLite versions are limited to 999
+    MAX_PARAMS = 999
+
+    # bytes of a read-only database that SQLite may access through mmap
+    MMAP_SIZE = 1<<30
+
+    def __init__(self, dbfilename=None, readonly=False):
+        """ If readonly is set, dbfilename must be an existing database that won't be modified
+        while it's open, each thread reading from it gets its own connection """
+
+        # rows waiting to be inserted, a dict is used as an ordered set so rows keep their insertion order
+        self._pending = {}
+
+        self.readonly = readonly
+        if readonly:
+            if not dbfilename or not os.path.exists(dbfilename):
+                raise ValueError("readonly requires an existing database", dbfilename)
+            self._uri = pathlib.Path(dbfilename).resolve().as_uri() + "?mode=ro&immutable=1"
+            self._local = threading.local()
+            self._connections = weakref.WeakSet()
+            self._connections_lock = threading.Lock()
+
+        elif dbfilename:
+            existing = os.path.exists(dbfilename)
+            self._dbcon = sqlite3.connect(dbfilename, check_same_thread=False)
+            self._dbcon.execute('PRAGMA synchronous=OFF;')
+
+            if not existing:
+                self._dbcon.execute('''CREATE TABLE forms (form text, pos text, lemma text, UNIQUE(form,pos,lemma))''')
+        else:
+            self._dbcon = sqlite3.connect(":memory:", check_same_thread=False)
+            self._dbcon.execute('''CREATE TABLE forms (form text, pos text, lemma text, UNIQUE(form,pos,lemma))''')
+
+    @property
+    def dbcon(self):
+        if not self.readonly:
+            return self._dbcon
+
+        # connections can't be shared across threads or inherited by forked processes
+        local = self._local
+        thread_con = getattr(local, "thread_con", None)
+        if thread_con is None or thread_con.pid != os.getpid():
+            thread_con = self._connect()
+            local.thread_con = thread_con
+        return thread_con.dbcon
+
+    def _connect(self):
+        """ Returns a new connection to the read-only database
+
+        Only the thread's local storage holds the returned _ThreadConnection, so the
+        connection is closed when the thread exits
+        """
+        dbcon = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        dbcon.execute(f'PRAGMA mmap_size={self.MMAP_SIZE};')
+        dbcon.execute('PRAGMA query_only=ON;')
+        thread_con = _ThreadConnection(dbcon)
+        with self._connections_lock:
+            self._connections.add(thread_con)
+        return thread_con
+
+    def close(self):
+        if not self.readonly:
+            self._dbcon.close()
+            return
+
+        with self._connections_lock:
+            for thread_con in list(self._connections):
+                thread_con.close()
+            self._connections = weakref.WeakSet()
+        self._local = threading.local()
+
+    def get_lemmas(self, word, filter_pos=None):
+        if filter_pos:
+            if isinstance(filter_pos, list):
+                in_clause = ",".join(["?"]*len(filter_pos))
+                res = self.dbcon.execute(f"SELECT pos || '|' || lemma FROM forms WHERE form=? AND pos IN ({in_clause}) ORDER BY pos, lemma", (word, *filter_pos))
+            else:
+                res = self.dbcon.execute("SELECT pos || '|' || lemma FROM forms WHERE form=? AND pos=? ORDER BY pos, lemma", (word, filter_pos))
+        else:
+            res = self.dbcon.execute("SELECT pos || '|' || lemma FROM forms WHERE form=? ORDER BY pos, lemma", (word,))
+
+        return [x[0] for x in res]
+
+    def get_lemma_forms(self, lemma, filter_pos=None):
+        if filter_pos:
+            res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE lemma=? AND pos=?", (lemma, filter_pos,))
+        else:
+            res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE lemma=?", (lemma,))
+
+        return [x[0] for x in res]
+
+    def get_lemmas_many(self, words, filter_pos=None):
+        """ Returns { word: get_lemmas(word, filter_pos) } for every word in words """
+        res = {word:[] for word in words}
+        for where, params in self._iter_batches("form", res, filter_pos):
+            for form, lemma in self.dbcon.execute(f"SELECT form, pos || '|' || lemma FROM forms WHERE {where} ORDER BY form, pos, lemma", params):
+                res[form].append(lemma)
+        return res
+
+    def get_lemma_forms_many(self, lemmas, pos=None):
+        """ Returns { lemma: get_lemma_forms(lemma, pos) } for every lemma in lemmas """
+        res = {lemma:{} for lemma in lemmas}
+        for where, params in self._iter_batches("lemma", res, pos):
+            for lemma, form in self.dbcon.execute(f"SELECT lemma, form FROM forms WHERE {where}", params):
+                res[lemma][form] = None
+        return {lemma:list(forms) for lemma, forms in res.items()}
+
+    def _iter_batches(self, column, values, filter_pos):
+        """ Yields (where clause, params) pairs matching column against all of the values,
+        split into batches that stay below the query parameter limit """
+        if isinstance(filter_pos, list):
+            pos_params = filter_pos
+        elif filter_pos:
+            pos_params = [filter_pos]
+        else:
+            pos_params = []
+
+        pos_clause = f" AND pos IN ({','.join(['?']*len(pos_params))})" if pos_params else ""
+        batch_size = max(1, self.MAX_PARAMS - len(pos_params))
+
+        values = list(values)
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i+batch_size]
+            yield f"{column} IN ({','.join(['?']*len(batch))}){pos_clause}", batch + pos_params
+
+    def has_form(self, form, pos=None):
+        if pos:
+            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? AND pos=? LIMIT 1", (form, pos,))
+        else:
+            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? LIMIT 1", (form,))
+        return bool(list(res))
+
+    def has_lemma(self, lemma, pos=None):
+        if pos:
+            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? and lemma=? AND pos=? LIMIT 1", (lemma, lemma, pos,))
+        else:
+            res = self.dbcon.execute(f"SELECT form FROM forms WHERE form=? and lemma=? LIMIT 1", (lemma,lemma))
+        return bool(list(res))
+
+    def get_form_pos(self, form):
+        for x in self.dbcon.execute(f"SELECT DISTINCT pos FROM forms WHERE form=?", (form,)):
+            yield x[0]
+
+    @property
+    def all_lemmas(self):
+        for x in self.dbcon.execute("SELECT DISTINCT lemma FROM forms ORDER BY lemma"):
+            yield x[0]
+
+    @property
+    def all_forms(self):
+        for x in self.dbcon.execute("SELECT DISTINCT form FROM forms ORDER BY form"):
+            yield x[0]
+
+    @property
+    def all(self):
+        return self.dbcon.execute("SELECT form, pos, lemma  FROM forms ORDER BY form, pos, lemma")
+
+    def get_all_forms(self, filter_pos):
+        if filter_pos:
+            if isinstance(filter_pos, list):
+                in_clause = ",".join(["?"]*len(filter_pos))
+                res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE pos IN ({in_clause})")
+            else:
+                res = self.dbcon.execute(f"SELECT DISTINCT form FROM forms WHERE pos=?", (filter_pos,))
+
+        return [x[0] for x in res]
+
+    @classmethod
+    def from_data(cls, allforms_data, dbfilename=None):
+        self = cls(dbfilename)
+        self._load_data(allforms_data)
+        return self
+
+    @classmethod
+    def from_file(cls, filename, cache_words=True, readonly=False):
+        # check for cached version
+        cached = filename + ".sqlite"
+        if os.path.exists(cached):
+            if os.path.getctime(cached) > os.path.getctime(filename):
+                return cls(cached, readonly=readonly)
+
+            # delete the old cache
+            os.remove(cached)
+
+        with open(filename) as infile:
+            self = cls.from_data(infile, cached)
+
+        if readonly:
+            self.close()
+            return cls(cached, readonly=True)
+
+        return self
+
+    def _begin_load(self):
+        self.dbcon.execute("BEGIN TRANSACTION;")
+
+    def _end_load(self, lemma_index=False):
+        self._flush_forms()
+        self.dbcon.execute('''CREATE INDEX idx_form_pos ON forms (form, pos)''')
+        if lemma_index:
+            self.dbcon.execute('''CREATE INDEX idx_lemma ON forms (lemma)''')
+        self.dbcon.execute("COMMIT;")
+
+    def _add_row(self, form, pos, lemma):
+        self._pending[(form, pos, lemma)] = None
+        if len(self._pending) >= self.BATCH_SIZE:
+            self._flush_forms()
+
+    def _flush_forms(self):
+        """ Write any rows collected by _add_form to the database """
+        if self._pending:
+            self.dbcon.executemany("INSERT OR IGNORE INTO forms VALUES (?, ?, ?)", self._pending)
+            self._pending.clear()
+
+
+class MemoryAllForms(BaseAllForms):
+    """ AllForms stored in Python dicts instead of SQLite
+
+    Uses more memory than the SQLite backend, but lookups don't have the overhead
+    of an SQL query. Use MemoryAllForms.from_file() or MemoryAllForms.from_wordlist()
+    in place of the AllForms equivalents
+    """
+
+    def __init__(self):
+        # dicts are used as ordered sets so that rows keep their insertion order
+        self._forms = {} # { form: { (pos, lemma): None } }
+        self._lemmas = {} # { lemma: { (form, pos): None } }
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename) as infile:
+            return cls.from_data(infile)
+
+    def close(self):
+        pass
+
+    def _add_row(self, form, pos, lemma):
+        form = sys.intern(form)
+        pos = sys.intern(pos)
+        lemma = sys.intern(lemma)
+
+        rows = self._forms.get(form)
+        if rows is None:
+            rows = self._forms[form] = {}
+        elif (pos, lemma) in rows:
+            return
+
+        rows[(pos, lemma)] = None
+
+        lemma_rows = self._lemmas.get(lemma)
+        if lemma_rows is None:
+            lemma_rows = self._lemmas[lemma] = {}
+        lemma_rows[(form, pos)] = None
+
+    def get_lemmas(self, word, filter_pos=None):
+        rows = self._forms.get(word, {})
+        if filter_pos:
+            if isinstance(filter_pos, list):
+                rows = [x for x in rows if x[0] in filter_pos]
+            else:
+                rows = [x for x in rows if x[0] == filter_pos]
+
+        return [f"{pos}|{lemma}" for pos, lemma in sorted(rows)]
+
+    def get_lemma_forms(self, lemma, filter_pos=None):
+        forms = {}
+        for form, pos in self._lemmas.get(lemma, {}):
+            if not filter_pos or pos == filter_pos:
+                forms[form] = None
+        return list(forms)
+
+    def get_lemmas_many(self, words, filter_pos=None):
+        return {word:self.get_lemmas(word, filter_pos) for word in words}
+
+    def get_lemma_forms_many(self, lemmas, pos=None):
+        return {lemma:self.get_lemma_forms(lemma, pos) for lemma in lemmas}
+
+    def has_form(self, form, pos=None):
+        rows = self._forms.get(form)
+        if not rows:
+            return False
+        if pos:
+            return any(p == pos for p, lemma in rows)
+        return True
+
+    def has_lemma(self, lemma, pos=None):
+        rows = self._forms.get(lemma, {})
+        return any(l == lemma and (not pos or p == pos) for p, l in rows)
+
+    def get_form_pos(self, form):
+        yield from sorted({pos for pos, lemma in self._forms.get(form, {})})
+
+    @property
+    def all_lemmas(self):
+        yield from sorted(self._lemmas)
+
+    @property
+    def all_forms(self):
+        yield from sorted(self._forms)
+
+    @property
+    def all(self):
+        for form in sorted(self._forms):
+            for pos, lemma in sorted(self._forms[form]):
+                yield form, pos, lemma
+
+    def get_all_forms(self, filter_pos):
+        if isinstance(filter_pos, list):
+            return [form for form, rows in self._forms.items() if any(pos in filter_pos for pos, lemma in rows)]
+        return [form for form, rows in self._forms.items() if any(pos == filter_pos for pos, lemma in rows)]
@@ -0,0 +1,202 @@
+import array
+import mmap
+import os
+import struct
+
+from collections.abc import Mapping
+
+from .source_stamp import SourceStamp
+
+class EntryCache(Mapping):
+    """ Read-only { title: [lines] } mapping backed by a binary cache file
+
+    The cache file is memory-mapped when opened and entries are only decoded when
+    they are requested, so opening a cache has the same cost regardless of its size
+
+    File layout (native byte order, each section aligned to 8 bytes):
+        header
+        string offsets   u64 * (string_count+1)
+        string data      utf-8, strings are sorted so that ids sort in the same order as the strings
+        entry offsets    u64 * entry_count, offset (in u32 units) of each entry block, in file order
+        entry blocks     u32 title_id, u32 line_count, u32 line_id * line_count
+        title index      u32 title_id * entry_count, sorted
+        entry index      u32 entry_number * entry_count, matching the title index
+    """
+
+    MAGIC = b"WLCACHE\0"
+    VERSION = 1
+
+    # magic, version, source stamp, string count, entry count, section offsets
+    _header = struct.Struct(f"=8sIxxxx{SourceStamp.size}sQQQQQQQQQ")
+    _stamp_offset = struct.calcsize("=8sIxxxx")
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as infile:
+            self._mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = self._header.unpack_from(self._mm)
+        magic, version, self._stamp, string_count, entry_count, *sections = header
+
+        if magic != self.MAGIC or version != self.VERSION:
+            self._mm.close()
+            raise ValueError("Unsupported cache file", filename)
+
+        str_offsets, str_data, entry_offsets, entries, title_index, entry_index, end = sections
+
+        mv = memoryview(self._mm)
+        self._string_offsets = mv[str_offsets:str_data].cast("Q")
+        self._string_data = str_data
+        self._entry_offsets = mv[entry_offsets:entries].cast("Q")
+        self._entries = mv[entries:title_index].cast("I")
+        self._title_index = mv[title_index:title_index+entry_count*4].cast("I")
+        self._entry_index = mv[entry_index:entry_index+entry_count*4].cast("I")
+
+    @classmethod
+    def open(cls, filename, source):
+        """ Returns an EntryCache for filename if it exists and was built from source, otherwise None """
+        if not os.path.exists(filename):
+            return None
+
+        try:
+            cache = cls(filename)
+        except (ValueError, struct.error):
+            return None
+
+        if cache.is_valid(source):
+            return cache
+
+    def is_valid(self, source):
+        """ Returns True if the cache was built from the current content of source
+        mtime and size are checked first, the content hash is only checked if the mtime differs
+        and the stored mtime is updated when the content still matches """
+        return SourceStamp.check(self._stamp, source, self.filename, self._stamp_offset)
+
+    @classmethod
+    def write(cls, filename, source, entries):
+        """ Write the title, lines pairs from entries to a cache file for source """
+
+        entries = [(title, list(lines)) for title, lines in entries]
+
+        strings = sorted({s for title, lines in entries for s in [title] + lines})
+        string_ids = {s:i for i,s in enumerate(strings)}
+
+        string_offsets = [0]
+        string_data = bytearray()
+        for s in strings:
+            string_data += s.encode()
+            string_offsets.append(len(string_data))
+        del strings
+
+        entry_offsets = []
+        entry_data = []
+        titles = {}
+        for title, lines in entries:
+            # duplicate titles use the data of the last entry, like a dict
+            if title in titles:
+                entry_offsets[titles[title]] = len(entry_data)
+            else:
+                titles[title] = len(entry_offsets)
+                entry_offsets.append(len(entry_data))
+            entry_data += [string_ids[title], len(lines)] + [string_ids[line] for line in lines]
+
+        title_index = sorted((string_ids[title], i) for title, i in titles.items())
+
+        sections = [
+            array.array("Q", string_offsets).tobytes(),
+            bytes(string_data),
+            array.array("Q", entry_offsets).tobytes(),
+            array.array("I", entry_data).tobytes(),
+            array.array("I", (x[0] for x in title_index)).tobytes(),
+            array.array("I", (x[1] for x in title_index)).tobytes(),
+        ]
+
+        offsets = []
+        pos = cls._header.size
+        for data in sections:
+            pos = cls._align(pos)
+            offsets.append(pos)
+            pos += len(data)
+        offsets.append(pos)
+
+        header = cls._header.pack(cls.MAGIC, cls.VERSION, SourceStamp.get(source),
+                len(string_offsets)-1, len(entry_offsets), *offsets)
+
+        # write to a temporary file so readers never see a partial cache
+        tmpfile = f"{filename}.{os.getpid()}.tmp"
+        with open(tmpfile, "wb") as outfile:
+            outfile.write(header)
+            for offset, data in zip(offsets, sections):
+                outfile.write(b"\0" * (offset - outfile.tell()))
+                outfile.write(data)
+        os.replace(tmpfile, filename)
+
+    @staticmethod
+    def _align(pos):
+        return (pos + 7) & ~7
+
+    def _get_string(self, string_id):
+        start = self._string_data + self._string_offsets[string_id]
+        end = self._string_data + self._string_offsets[string_id+1]
+        return self._mm[start:end].decode()
+
+    def _find_string(self, value):
+        """ Returns the id of the given string or None """
+        lo = 0
+        hi = len(self._string_offsets) - 1
+        while lo < hi:
+            mid = (lo+hi)//2
+            mid_value = self._get_string(mid)
+            if mid_value == value:
+                return mid
+            if mid_value < value:
+                lo = mid+1
+            else:
+                hi = mid
+
+    def _find(self, title):
+        """ Returns the entry number of the given title or None """
+        if not isinstance(title, str):
+            return None
+
+        title_id = self._find_string(title)
+        if title_id is None:
+            return None
+
+        lo = 0
+        hi = len(self._title_index)
+        while lo < hi:
+            mid = (lo+hi)//2
+            mid_id = self._title_index[mid]
+            if mid_id == title_id:
+                return self._entry_index[mid]
+            if mid_id < title_id:
+                lo = mid+1
+            else:
+                hi = mid
+
+    def _get_entry(self, entry_number):
+        offset = self._entry_offsets[entry_number]
+        title_id, count = self._entries[offset:offset+2]
+        line_ids = self._entries[offset+2:offset+2+count]
+        return self._get_string(title_id), [self._get_string(i) for i in line_ids]
+
+    def __getitem__(self, title):
+        entry_number = self._find(title)
+        if entry_number is None:
+            raise KeyError(title)
+        return self._get_entry(entry_number)[1]
+
+    def __contains__(self, title):
+        return self._find(title) is not None
+
+    def __iter__(self):
+        for offset in self._entry_offsets:
+            yield self._get_string(self._entries[offset])
+
+    def __len__(self):
+        return len(self._entry_offsets)
+
+    def items(self):
+        for entry_number in range(len(self._entry_offsets)):
+            yield self._get_entry(entry_number)
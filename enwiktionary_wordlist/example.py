@@ -2,6 +2,9 @@ import re
 import sys
 
 class Example():
+
+    __slots__ = ("text", "english", "source", "type")
+
     def __init__(self, data):
 
         self.text = None
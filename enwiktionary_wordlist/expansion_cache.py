@@ -0,0 +1,113 @@
+import sqlite3
+
+class ExpansionCache():
+    """ Memoizes template expansions, optionally stored in an sqlite database so they
+    can be reused across runs
+
+    Expansions are keyed on the template text and, if the expansion depends on it, the page title.
+    The first time a template is seen it is expanded again with probe titles, if the results are
+    identical the expansion is stored without a title and reused for every page using the template.
+
+    The stored expansions are not invalidated when the template modules change, delete the database
+    after updating enwiktionary_templates
+    """
+
+    PROBE_TITLES = ["xyzzy", "pñaz"]
+
+    def __init__(self, dbfilename=None):
+        self.hits = 0
+        self.misses = 0
+
+        # template text -> expansion, for templates that don't depend on the title
+        self._independent = {}
+        # template texts that depend on the title
+        self._dependent = set()
+        # (template text, title) -> expansion, for templates that depend on the title
+        self._expansions = {}
+
+        self.dbcon = None
+        self._detached = None
+        if dbfilename:
+            self.dbcon = sqlite3.connect(dbfilename)
+            self.dbcon.execute('PRAGMA synchronous=OFF;')
+            self.dbcon.execute('''CREATE TABLE IF NOT EXISTS expansions (template text, title text, expansion text, PRIMARY KEY(template, title))''')
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits/total if total else 0
+
+    def expand(self, text, title, expand_func):
+        """ Returns expand_func(text, title), using a cached value when available """
+        text = str(text)
+
+        res = self._independent.get(text)
+        if res is None:
+            res = self._expansions.get((text, title))
+        if res is None:
+            res = self._get_stored(text, title)
+        if res is not None:
+            self.hits += 1
+            return res
+
+        self.misses += 1
+        res = expand_func(text, title)
+
+        if text in self._dependent or not self._is_independent(text, title, res, expand_func):
+            self._dependent.add(text)
+            self._expansions[(text, title)] = res
+            self._store(text, title, res)
+        else:
+            self._independent[text] = res
+            self._store(text, "", res)
+
+        return res
+
+    def _is_independent(self, text, title, res, expand_func):
+        """ Returns True if expanding text gives the same result with any title """
+        if title and title in res:
+            return False
+
+        for probe in self.PROBE_TITLES:
+            try:
+                if expand_func(text, probe) != res:
+                    return False
+            except Exception:
+                return False
+
+        return True
+
+    def _get_stored(self, text, title):
+        if not self.dbcon:
+            return None
+
+        # prefer an expansion for this title over one stored for every title
+        for stored_title, expansion in self.dbcon.execute("SELECT title, expansion FROM expansions WHERE template=? AND title IN (?, '') ORDER BY title=''", (text, title)):
+            if stored_title == "":
+                self._independent[text] = expansion
+            else:
+                self._dependent.add(text)
+                self._expansions[(text, title)] = expansion
+            return expansion
+
+    def _store(self, text, title, res):
+        if self.dbcon:
+            self.dbcon.execute("INSERT OR REPLACE INTO expansions VALUES (?, ?, ?)", (text, title, res))
+
+    def commit(self):
+        if self.dbcon:
+            self.dbcon.commit()
+
+    def detach(self):
+        """ Stops using the database, for use in forked processes that inherited the connection
+        Expansions are still cached in memory """
+
+        # keep a reference, closing the inherited connection could interfere with the parent process
+        self._detached = self.dbcon
+        self.dbcon = None
+
+    def close(self):
+        if self.dbcon:
+            self.dbcon.commit()
+            self.dbcon.close()
+            self.dbcon = None
@@ -0,0 +1,44 @@
+import sqlite3
+
+class ExportState():
+    """ Rendered dictunformat pages from previous exports, stored in an sqlite database
+
+    Pages are keyed on a fingerprint of everything used to render them, see
+    WordlistToDictunformat.get_page_fingerprint(). Pages that weren't used by
+    the current export are removed when the state is closed.
+
+    The stored pages are not invalidated when the rendering code changes, delete the
+    database after updating enwiktionary_wordlist
+    """
+
+    def __init__(self, dbfilename):
+        self.reused = 0
+        self.rendered = 0
+
+        self.dbcon = sqlite3.connect(dbfilename)
+        self.dbcon.execute('PRAGMA synchronous=OFF;')
+        self.dbcon.execute('''CREATE TABLE IF NOT EXISTS pages (fingerprint text PRIMARY KEY, entry text, used integer)''')
+        self.dbcon.execute("UPDATE pages SET used=0")
+
+    def __contains__(self, fingerprint):
+        return bool(list(self.dbcon.execute("SELECT 1 FROM pages WHERE fingerprint=?", (fingerprint,))))
+
+    def get(self, fingerprint):
+        """ Returns the stored entry for fingerprint, or None """
+        for entry, in self.dbcon.execute("SELECT entry FROM pages WHERE fingerprint=?", (fingerprint,)):
+            self.reused += 1
+            self.dbcon.execute("UPDATE pages SET used=1 WHERE fingerprint=?", (fingerprint,))
+            return entry
+
+    def store(self, fingerprint, entry):
+        self.rendered += 1
+        self.dbcon.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, 1)", (fingerprint, entry))
+
+    def close(self, prune=True):
+        """ Saves the state, if prune is set pages that weren't used since it was opened are deleted """
+        if self.dbcon:
+            if prune:
+                self.dbcon.execute("DELETE FROM pages WHERE used=0")
+            self.dbcon.commit()
+            self.dbcon.close()
+            self.dbcon = None
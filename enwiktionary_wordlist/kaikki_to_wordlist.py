@@ -1,15 +1,116 @@
 #!/usr/bin/python3
 
+import builtins
 import csv
+import heapq
+import itertools
 import json
+import os
 import re
+import smart_open
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from smart_open import open
 
 from collections import defaultdict, namedtuple
 
 Example = namedtuple("Example", [ "type", "source", "text", "english" ])
 
+class LemmaDict(defaultdict):
+    """ { lemma: { pos: [items] } } """
+
+    def __init__(self):
+        super().__init__(lambda: defaultdict(list))
+
+    def add(self, lemma, pos, item):
+        self[lemma][pos].append(item)
+
+    def sorted_items(self):
+        return sorted(self.items())
+
+    def close(self):
+        pass
+
+class LemmaRuns():
+    """ Stores lemma items in sorted run files instead of memory
+
+    Items are buffered until there are spill_size of them, then sorted by lemma and written
+    to a temporary file. sorted_items() merges the files and returns the same data as
+    LemmaDict.sorted_items() """
+
+    # maximum number of run files open at once while merging
+    MERGE_FANIN = 64
+
+    def __init__(self, spill_size, tmpdir=None):
+        self.spill_size = spill_size
+        self._tmp = tempfile.TemporaryDirectory(dir=tmpdir)
+        self._runs = []
+        self._run_count = 0
+        self._buffer = []
+        # items are stored with their sequence number so the merge keeps the order they were added
+        self._seq = 0
+
+    def add(self, lemma, pos, item):
+        self._buffer.append((lemma, self._seq, pos, item))
+        self._seq += 1
+        if len(self._buffer) >= self.spill_size:
+            self._spill()
+
+    def _spill(self):
+        if not self._buffer:
+            return
+
+        self._buffer.sort(key=lambda x: (x[0], x[1]))
+        self._runs.append(self._write_run(self._buffer))
+        self._buffer = []
+
+    def _write_run(self, records):
+        """ Writes the sorted records to a new run file and returns its filename """
+        filename = os.path.join(self._tmp.name, f"{self._run_count}.jsonl")
+        self._run_count += 1
+        with builtins.open(filename, "w", encoding="utf-8") as outfile:
+            for record in records:
+                outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return filename
+
+    @staticmethod
+    def _read_run(filename):
+        with builtins.open(filename, encoding="utf-8") as infile:
+            for line in infile:
+                lemma, seq, pos, item = json.loads(line)
+                for sense in item["senses"]:
+                    if "examples" in sense:
+                        sense["examples"] = [Example(*example) for example in sense["examples"]]
+                yield lemma, seq, pos, item
+
+    def _merge_runs(self, filenames):
+        return heapq.merge(*map(self._read_run, filenames), key=lambda x: (x[0], x[1]))
+
+    def sorted_items(self):
+        """ Yields lemma, { pos: [items] } sorted by lemma, pos are in the order they were first added """
+        self._spill()
+
+        # merge groups of runs into larger runs until they can all be opened at once
+        while len(self._runs) > self.MERGE_FANIN:
+            runs = []
+            for i in range(0, len(self._runs), self.MERGE_FANIN):
+                group = self._runs[i:i+self.MERGE_FANIN]
+                runs.append(self._write_run(self._merge_runs(group)))
+                for filename in group:
+                    os.remove(filename)
+            self._runs = runs
+
+        runs = self._merge_runs(self._runs)
+        for lemma, records in itertools.groupby(runs, key=lambda x: x[0]):
+            all_pos = defaultdict(list)
+            for _, seq, pos, item in records:
+                all_pos[pos].append(item)
+            yield lemma, all_pos
+
+    def close(self):
+        self._tmp.cleanup()
+
 class KaikkiToWordlist():
 
     # Ignore badly parsed formdata
@@ -48,14 +149,169 @@ class KaikkiToWordlist():
     ]
     RE_FORMTYPE = "(?:" + "|".join(_form_terms) +")+"
 
-    def __init__(self, filename, include_self_declared_forms=False):
-        self.all_forms = self.load_forms(filename, include_self_declared_forms)
-        self.all_lemmas = self.load_lemmas(filename, self.all_forms)
+    _combined_pattern = re.compile(f"({RE_FORMTYPE}) of (.*?) combined with (.*)", re.IGNORECASE)
+    _formtype_pattern = re.compile(f"({RE_FORMTYPE})+ of (.*)", re.IGNORECASE)
+    _inflection_pattern = re.compile("inflection of (.*?):\n##.*", re.IGNORECASE)
+
+    # bytes of the file decoded by each task of a parallel load
+    CHUNK_SIZE = 1<<24
+
+    def __init__(self, filename, include_self_declared_forms=False, single_pass=True, workers=None, spill_size=None, tmpdir=None):
+        """ If single_pass is set, the file is read and decoded once and the lemma data is held
+        in memory until all forms are known. Otherwise, the file is read twice, which uses less
+        memory
+
+        If workers is set, single pass loads of uncompressed files are split into chunks that
+        are decoded by a pool of worker processes
+
+        If spill_size is set, the lemma data is stored in temporary files in tmpdir, sorted in runs
+        of spill_size items, and the file is always read twice so that memory use doesn't depend
+        on the size of the file """
+
+        if spill_size and workers:
+            raise ValueError("workers can't be used with spill_size, spilled loads read the file twice")
+        if workers and not single_pass:
+            raise ValueError("workers can only be used with single_pass loads")
+
+        all_lemmas = LemmaRuns(spill_size, tmpdir) if spill_size else LemmaDict()
+        # single pass loads hold every possible lemma in memory until all forms are known
+        if single_pass and not spill_size:
+            self.all_forms, self.all_lemmas = self.load(filename, include_self_declared_forms, workers, all_lemmas)
+        else:
+            self.all_forms = self.load_forms(filename, include_self_declared_forms)
+            self.all_lemmas = self.load_lemmas(filename, self.all_forms, all_lemmas)
+
+    def close(self):
+        """ Removes any temporary files """
+        self.all_lemmas.close()
 
     @classmethod
-    def load_lemmas(cls, filename, all_forms):
+    def load(cls, filename, include_self_declared=False, workers=None, all_lemmas=None):
+        """ Returns all_forms, all_lemmas, the same as load_forms() and load_lemmas(), reading the file once """
 
-        all_lemmas = defaultdict(lambda: defaultdict(list))
+        # smart_open decompresses files based on their extension, those can't be split into byte ranges
+        compressed = os.path.splitext(filename)[1] in smart_open.compression.get_supported_extensions()
+        if not workers or workers < 2 or compressed or not os.path.isfile(filename):
+            with open(filename) as infile:
+                all_forms, candidates = cls._load_lines(infile, include_self_declared)
+            return all_forms, cls._get_lemmas(all_forms, candidates, all_lemmas)
+
+        all_forms = defaultdict(set)
+        candidates = []
+        # smaller chunks keep the results of each task small, but there should be one for each worker
+        chunk_size = min(cls.CHUNK_SIZE, -(-os.path.getsize(filename) // workers))
+        chunks = cls._get_chunks(filename, chunk_size)
+        with ProcessPoolExecutor(workers) as executor:
+            # map() returns the chunks in order, so the lemmas are added in the same order as a serial load
+            for chunk_forms, chunk_candidates in executor.map(cls._load_chunk, itertools.repeat(filename), chunks, itertools.repeat(include_self_declared)):
+                for k, forms in chunk_forms.items():
+                    all_forms[k] |= forms
+                candidates += chunk_candidates
+
+        return all_forms, cls._get_lemmas(all_forms, candidates, all_lemmas)
+
+    @staticmethod
+    def _get_chunks(filename, chunk_size):
+        """ Returns a list of (start, end) byte ranges that split filename into chunks of roughly
+        chunk_size bytes. Each chunk starts at the beginning of a line """
+
+        size = os.path.getsize(filename)
+        boundaries = [0]
+        with builtins.open(filename, "rb") as infile:
+            for target in range(chunk_size, size, chunk_size):
+                pos = max(target, boundaries[-1])
+                if pos:
+                    # skip the partial line
+                    infile.seek(pos-1)
+                    infile.readline()
+                    pos = infile.tell()
+                if boundaries[-1] < pos < size:
+                    boundaries.append(pos)
+
+        boundaries.append(size)
+        return list(zip(boundaries, boundaries[1:]))
+
+    @classmethod
+    def _load_chunk(cls, filename, chunk, include_self_declared):
+        start, end = chunk
+        with builtins.open(filename, "rb") as infile:
+            infile.seek(start)
+            all_forms, candidates = cls._load_lines(cls._iter_chunk_lines(infile, end), include_self_declared)
+        return dict(all_forms), candidates
+
+    @staticmethod
+    def _iter_chunk_lines(infile, end):
+        """ Yields the decoded lines of a binary file from the current position until end """
+        while infile.tell() < end:
+            line = infile.readline()
+            if not line:
+                break
+            yield line.decode()
+
+    @classmethod
+    def _load_lines(cls, lines, include_self_declared):
+        """ Returns all_forms and a list of (lemma, pos, item, form_refs) for the entries that may be lemmas
+        is_generated_form() can only be resolved for those entries once all forms are loaded """
+
+        all_forms = defaultdict(set)
+        candidates = []
+
+        for line in lines:
+            data = json.loads(line)
+
+            if '"forms"' in line:
+                cls.add_lemma_forms(all_forms, data)
+            elif include_self_declared:
+                cls.add_self_declared_forms(all_forms, data)
+
+            form_refs = cls.get_form_refs(data)
+            if form_refs is not None and cls.is_known_form_of(data.get("word"), data.get("pos"), form_refs, all_forms):
+                # forms are never removed, so known forms will still be known at the end
+                continue
+
+            lemma_item = cls.make_lemma_item(data)
+            if lemma_item:
+                candidates.append((*lemma_item, form_refs))
+
+        return all_forms, candidates
+
+    @classmethod
+    def _get_lemmas(cls, all_forms, candidates, all_lemmas=None):
+        if all_lemmas is None:
+            all_lemmas = LemmaDict()
+
+        for lemma, pos, item, form_refs in candidates:
+            if form_refs is not None and cls.is_known_form_of(lemma, pos, form_refs, all_forms):
+                continue
+            all_lemmas.add(lemma, pos, item)
+
+        return all_lemmas
+
+    @staticmethod
+    def is_known_form_of(form, pos, lemmas, all_forms):
+        return all(form in all_forms.get((lemma, pos), []) for lemma in lemmas)
+
+    @classmethod
+    def get_form_refs(cls, form_data):
+        """ Returns the lemmas of the "form of" glosses of an entry,
+        or None if any gloss isn't a form of something, in which case the entry is never a generated form
+
+        is_generated_form() is True if the entry is a known form of every returned lemma """
+
+        refs = []
+        for sense in form_data.get("senses", []):
+            for gloss in sense.get("glosses", []):
+                formtype, lemma = cls.get_formtype(gloss)
+                if not formtype or not lemma:
+                    return None
+                refs.append(lemma)
+        return refs
+
+    @classmethod
+    def load_lemmas(cls, filename, all_forms, all_lemmas=None):
+
+        if all_lemmas is None:
+            all_lemmas = LemmaDict()
         with open(filename) as infile:
             for line in infile:
                 data = json.loads(line)
@@ -153,18 +409,22 @@ class KaikkiToWordlist():
     @classmethod
     def get_formtype(cls, gloss):
 
+        # All of the patterns need " of ", most glosses can be skipped without running them
+        if " of " not in gloss and " of " not in gloss.lower():
+            return None, None
+
         # Check for combined
-        match = re.match(f"({cls.RE_FORMTYPE}) of (.*?) combined with (.*)", gloss, re.IGNORECASE)
+        match = cls._combined_pattern.match(gloss)
         if match:
             return f"{match.group(1)} combined with {match.group(3)}", match.group(2)
 
         # Check for expected form type
-        match = re.match(f"({cls.RE_FORMTYPE})+ of (.*)", gloss, re.IGNORECASE)
+        match = cls._formtype_pattern.match(gloss)
         if match:
             return match.group(1), match.group(2)
 
         # Manual check for data generate by {{es-verb form of}}, which can only generate valid forms
-        match = re.match("inflection of (.*?):\n##.*", gloss, re.IGNORECASE)
+        match = cls._inflection_pattern.match(gloss)
         if match:
             return "smart_inflection", match.group(1)
 
@@ -214,6 +474,15 @@ class KaikkiToWordlist():
 
     @classmethod
     def add_lemma(cls, lemma_data, all_lemmas):
+        lemma_item = cls.make_lemma_item(lemma_data)
+        if not lemma_item:
+            return
+
+        all_lemmas.add(*lemma_item)
+
+    @classmethod
+    def make_lemma_item(cls, lemma_data):
+        """ Returns lemma, pos, item or None if the entry has no usable senses """
 
         senses = [cls.parse_sense(s) for s in lemma_data.get("senses", [])]
         senses = [s for s in senses if s]
@@ -243,40 +512,42 @@ class KaikkiToWordlist():
             item["etymology"] = ety
         item["senses"] = senses
 
-        all_lemmas[lemma][pos].append(item)
+        return lemma, pos, item
 
 
     @staticmethod
-    def print_value(depth, k, v):
-        try:
-            print('  '*depth + k + ": " + v.replace('\n', '\\n'))
-        except BaseException as e:
-            print("err", depth, k, v)
-            raise e
+    def format_value(depth, k, v):
+        return '  '*depth + k + ": " + v.replace('\n', '\\n') + "\n"
+
+    def dump_wordlist(self, outfile=None):
+        """ Writes the wordlist to outfile, or stdout """
 
-    def dump_wordlist(self):
+        if outfile is None:
+            outfile = sys.stdout
 
-        for lemma, all_pos in sorted(self.all_lemmas.items()):
-            print(f"_____\n{lemma}")
+        value = self.format_value
+        for lemma, all_pos in self.all_lemmas.sorted_items():
+            lines = [f"_____\n{lemma}\n"]
             for pos, items in all_pos.items():
                 for item in items:
-                    self.print_value(0, "pos", pos)
+                    lines.append(value(0, "pos", pos))
                     for k,v in sorted(item.items()):
                         if k != "senses":
-                            self.print_value(1, k, v)
+                            lines.append(value(1, k, v))
                     for sense in item["senses"]:
-                        self.print_value(1, "gloss", sense["gloss"])
+                        lines.append(value(1, "gloss", sense["gloss"]))
                         for k,v in sorted(sense.items()):
                             if k in ["gloss", "examples"]:
                                 continue
                             else:
-                                self.print_value(2, k, v)
+                                lines.append(value(2, k, v))
                         for example in sense.get("examples", []):
-                            self.print_value(2, "ex", example.text)
+                            lines.append(value(2, "ex", example.text))
                             if example.english:
-                                self.print_value(3, "eng", example.english)
+                                lines.append(value(3, "eng", example.english))
                             if example.source:
-                                self.print_value(3, "src", example.source)
+                                lines.append(value(3, "src", example.source))
+            outfile.write("".join(lines))
 
     def dump_allforms(self, filename):
 
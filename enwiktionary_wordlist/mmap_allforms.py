@@ -0,0 +1,307 @@
+import array
+import bisect
+import csv
+import mmap
+import os
+import struct
+
+from .all_forms import AllForms
+from .source_stamp import SourceStamp
+
+class MmapAllForms():
+    """ Read-only allforms backed by a memory-mapped binary index file
+
+    Provides the lookup methods of AllForms, indexes are built with from_csv() or from_allforms()
+    Opening an index only maps the file, lookups binary search the mapped tables so
+    worker processes using the same index share its pages through the page cache
+
+    File layout (native byte order, each section aligned to 8 bytes):
+        header
+        string offsets   u64 * (string_count+1)
+        string data      utf-8, strings are sorted so that ids sort in the same order as the strings
+        form table       u32 form_id, u32 pos_id, u32 lemma_id * row_count, sorted
+        lemma table      u32 lemma_id * lemma_count, sorted
+        posting offsets  u64 * (lemma_count+1), offset of each lemma's postings
+        postings         u32 row_number, rows of each lemma in form table order
+    """
+
+    MAGIC = b"WLFORMS\0"
+    VERSION = 2
+
+    # magic, version, source stamp, string count, row count, lemma count, section offsets
+    _header = struct.Struct(f"=8sIxxxx{SourceStamp.size}sQQQQQQQQQQ")
+    _stamp_offset = struct.calcsize("=8sIxxxx")
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as infile:
+            self._mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            header = self._header.unpack_from(self._mm)
+        except struct.error:
+            self._mm.close()
+            raise ValueError("Unsupported allforms index", filename)
+        magic, version, self._stamp, string_count, row_count, lemma_count, *sections = header
+
+        if magic != self.MAGIC or version != self.VERSION:
+            self._mm.close()
+            raise ValueError("Unsupported allforms index", filename)
+
+        str_offsets, str_data, rows, lemmas, posting_offsets, postings, end = sections
+
+        mv = memoryview(self._mm)
+        self._string_offsets = mv[str_offsets:str_data].cast("Q")
+        self._string_data = str_data
+        self._rows = mv[rows:rows+row_count*12].cast("I")
+        self._lemmas = mv[lemmas:lemmas+lemma_count*4].cast("I")
+        self._posting_offsets = mv[posting_offsets:postings].cast("Q")
+        self._postings = mv[postings:end].cast("I")
+
+        # columns of the form table
+        self._row_forms = self._rows[0::3]
+        self._row_pos = self._rows[1::3]
+        self._row_lemmas = self._rows[2::3]
+
+    def close(self):
+        for view in [self._row_forms, self._row_pos, self._row_lemmas, self._rows, self._lemmas,
+                self._string_offsets, self._posting_offsets, self._postings]:
+            view.release()
+        self._mm.close()
+
+    @classmethod
+    def is_index(cls, filename):
+        with open(filename, "rb") as infile:
+            return infile.read(len(cls.MAGIC)) == cls.MAGIC
+
+    @classmethod
+    def from_file(cls, filename, cache_words=True, readonly=True):
+        """ Opens filename if it is an index, otherwise filename is read as allforms CSV
+        and converted to a .idx sidecar file that is reused until the CSV changes """
+
+        if cls.is_index(filename):
+            return cls(filename)
+
+        cached = filename + ".idx"
+        if os.path.exists(cached):
+            try:
+                index = cls(cached)
+            except ValueError:
+                index = None
+
+            if index:
+                if index.is_valid(filename):
+                    return index
+                index.close()
+
+        with open(filename) as infile:
+            cls.from_csv(infile, cached, filename)
+        return cls(cached)
+
+    def is_valid(self, source):
+        """ Returns True if the index was built from the current content of the allforms CSV source """
+        return SourceStamp.check(self._stamp, source, self.filename, self._stamp_offset)
+
+    @classmethod
+    def from_csv(cls, allforms_data, filename, source=None):
+        """ Writes an index for the allforms CSV lines in allforms_data to filename
+        source is the name of the CSV file, if allforms_data was read from a file """
+        def iter_rows():
+            for form, pos, *lemmas in csv.reader(allforms_data):
+                if form == "-":
+                    continue
+                for lemma in lemmas:
+                    # forms may contain multiple values separated by |, like _add_form
+                    for f in form.split("|"):
+                        yield f, pos, lemma
+        cls.write(filename, iter_rows(), source)
+
+    @classmethod
+    def from_allforms(cls, allforms, filename):
+        """ Writes an index with the data of an existing AllForms to filename """
+        cls.write(filename, allforms.all)
+
+    @classmethod
+    def write(cls, filename, rows, source=None):
+        """ Write the form, pos, lemma tuples from rows to an index file """
+
+        rows = {tuple(row) for row in rows}
+
+        strings = sorted({s for row in rows for s in row})
+        string_ids = {s:i for i,s in enumerate(strings)}
+
+        string_offsets = [0]
+        string_data = bytearray()
+        for s in strings:
+            string_data += s.encode()
+            string_offsets.append(len(string_data))
+        del strings
+
+        rows = sorted(tuple(string_ids[s] for s in row) for row in rows)
+        del string_ids
+
+        lemma_rows = {}
+        for i, (form_id, pos_id, lemma_id) in enumerate(rows):
+            lemma_rows.setdefault(lemma_id, []).append(i)
+
+        lemmas = sorted(lemma_rows)
+        posting_offsets = [0]
+        postings = array.array("I")
+        for lemma_id in lemmas:
+            postings.extend(lemma_rows[lemma_id])
+            posting_offsets.append(len(postings))
+        del lemma_rows
+
+        sections = [
+            array.array("Q", string_offsets).tobytes(),
+            bytes(string_data),
+            array.array("I", (x for row in rows for x in row)).tobytes(),
+            array.array("I", lemmas).tobytes(),
+            array.array("Q", posting_offsets).tobytes(),
+            postings.tobytes(),
+        ]
+
+        offsets = []
+        pos = cls._header.size
+        for data in sections:
+            pos = cls._align(pos)
+            offsets.append(pos)
+            pos += len(data)
+        offsets.append(pos)
+
+        header = cls._header.pack(cls.MAGIC, cls.VERSION, SourceStamp.get(source),
+                len(string_offsets)-1, len(rows), len(lemmas), *offsets)
+
+        # write to a temporary file so readers never see a partial index
+        tmpfile = f"{filename}.{os.getpid()}.tmp"
+        with open(tmpfile, "wb") as outfile:
+            outfile.write(header)
+            for offset, data in zip(offsets, sections):
+                outfile.write(b"\0" * (offset - outfile.tell()))
+                outfile.write(data)
+        os.replace(tmpfile, filename)
+
+    @staticmethod
+    def _align(pos):
+        return (pos + 7) & ~7
+
+    def _get_string(self, string_id):
+        start = self._string_data + self._string_offsets[string_id]
+        end = self._string_data + self._string_offsets[string_id+1]
+        return self._mm[start:end].decode()
+
+    def _find_string(self, value):
+        """ Returns the id of the given string or None """
+        if not isinstance(value, str):
+            return None
+
+        lo = 0
+        hi = len(self._string_offsets) - 1
+        while lo < hi:
+            mid = (lo+hi)//2
+            mid_value = self._get_string(mid)
+            if mid_value == value:
+                return mid
+            if mid_value < value:
+                lo = mid+1
+            else:
+                hi = mid
+
+    def _get_form_rows(self, form):
+        """ Returns the range of form table rows for the given form """
+        form_id = self._find_string(form)
+        if form_id is None:
+            return range(0)
+        lo = bisect.bisect_left(self._row_forms, form_id)
+        hi = bisect.bisect_right(self._row_forms, form_id, lo)
+        return range(lo, hi)
+
+    def _get_lemma_rows(self, lemma):
+        """ Returns the form table row numbers for the given lemma, in form table order """
+        lemma_id = self._find_string(lemma)
+        if lemma_id is None:
+            return []
+        idx = bisect.bisect_left(self._lemmas, lemma_id)
+        if idx == len(self._lemmas) or self._lemmas[idx] != lemma_id:
+            return []
+        return self._postings[self._posting_offsets[idx]:self._posting_offsets[idx+1]]
+
+    def _match_pos(self, pos_id, filter_pos):
+        pos = self._get_string(pos_id)
+        if isinstance(filter_pos, list):
+            return pos in filter_pos
+        return pos == filter_pos
+
+    def get_lemmas(self, word, filter_pos=None):
+        res = []
+        for i in self._get_form_rows(word):
+            pos_id = self._row_pos[i]
+            if filter_pos and not self._match_pos(pos_id, filter_pos):
+                continue
+            res.append(f"{self._get_string(pos_id)}|{self._get_string(self._row_lemmas[i])}")
+        return res
+
+    def get_lemma_forms(self, lemma, filter_pos=None):
+        forms = {}
+        for i in self._get_lemma_rows(lemma):
+            if filter_pos and not self._match_pos(self._row_pos[i], filter_pos):
+                continue
+            forms[self._row_forms[i]] = None
+        return [self._get_string(form_id) for form_id in forms]
+
+    def get_lemmas_many(self, words, filter_pos=None):
+        return {word:self.get_lemmas(word, filter_pos) for word in words}
+
+    def get_lemma_forms_many(self, lemmas, pos=None):
+        return {lemma:self.get_lemma_forms(lemma, pos) for lemma in lemmas}
+
+    def has_form(self, form, pos=None):
+        rows = self._get_form_rows(form)
+        if pos:
+            return any(self._match_pos(self._row_pos[i], pos) for i in rows)
+        return bool(rows)
+
+    def has_lemma(self, lemma, pos=None):
+        lemma_id = self._find_string(lemma)
+        if lemma_id is None:
+            return False
+        return any(self._row_lemmas[i] == lemma_id and (not pos or self._match_pos(self._row_pos[i], pos))
+                for i in self._get_form_rows(lemma))
+
+    def get_form_pos(self, form):
+        pos_ids = {self._row_pos[i]:None for i in self._get_form_rows(form)}
+        for pos_id in pos_ids:
+            yield self._get_string(pos_id)
+
+    @property
+    def all_lemmas(self):
+        for lemma_id in self._lemmas:
+            yield self._get_string(lemma_id)
+
+    @property
+    def all_forms(self):
+        prev = None
+        for form_id in self._row_forms:
+            if form_id != prev:
+                yield self._get_string(form_id)
+                prev = form_id
+
+    @property
+    def all(self):
+        for i in range(len(self._row_forms)):
+            yield self._get_string(self._row_forms[i]), self._get_string(self._row_pos[i]), self._get_string(self._row_lemmas[i])
+
+    def get_all_forms(self, filter_pos):
+        res = {}
+        for i in range(len(self._row_forms)):
+            if self._match_pos(self._row_pos[i], filter_pos):
+                res[self._row_forms[i]] = None
+        return [self._get_string(form_id) for form_id in res]
+
+    @property
+    def all_csv(self):
+        return AllForms.iter_rows_csv(self.all)
+
+    def write_csv(self, outfile):
+        """ Writes the allforms CSV to outfile """
+        AllForms.write_rows_csv(outfile, self.all)
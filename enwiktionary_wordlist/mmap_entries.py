@@ -0,0 +1,290 @@
+import array
+import io
+import itertools
+import mmap
+import os
+import struct
+
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+from .source_stamp import SourceStamp
+
+class MmapEntries(Mapping):
+    """ Read-only { title: [lines] } mapping backed by a memory-mapped wordlist file
+
+    Only the byte offsets of each entry are held in memory, the lines of an entry
+    are parsed from the mapped file when the entry is requested
+
+    The offsets are found by scanning the file, if use_index is set they are saved to a
+    .~idx file alongside the wordlist and later opens map the saved offsets instead
+
+    If workers is set, the scan is split into chunks at entry separators and each chunk is
+    scanned by a pool of worker processes, which only return the titles and offsets they found
+
+    Index file layout (native byte order):
+        header
+        starts    u64 * entry_count, offset of the title line of each entry
+        ends      u64 * entry_count, offset of the end of each entry
+        order     u32 * title_count, entry numbers in file order
+        sorted    u32 * title_count, entry numbers sorted by title
+    """
+
+    INDEX_MAGIC = b"WLOFFS\0\0"
+    INDEX_VERSION = 1
+
+    # magic, version, source stamp, entry count, title count
+    _index_header = struct.Struct(f"=8sIxxxx{SourceStamp.size}sQQ")
+    _stamp_offset = struct.calcsize("=8sIxxxx")
+
+    def __init__(self, filename, use_index=True, workers=None):
+        self.filename = filename
+        with open(filename, "rb") as infile:
+            if not infile.read(5) == b"_____":
+                raise ValueError("mmap backend requires a wordlist file, mbformat is not supported", filename)
+            self._mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._index_mm = None
+        index = filename + ".~idx"
+        if use_index and self._load_index(index):
+            return
+
+        self._scan(workers)
+        if use_index:
+            try:
+                self._write_index(index)
+            except OSError:
+                # the wordlist is still usable without an index, it will be scanned again next time
+                pass
+
+    def _scan(self, workers=None):
+        # offsets of the title line and the end of each entry, in file order
+        self._starts = array.array("Q")
+        self._ends = array.array("Q")
+
+        titles = {}
+        for chunk_titles, starts, ends in self._scan_chunks(workers):
+            offset = len(self._starts)
+            for i, title in enumerate(chunk_titles):
+                titles[title] = offset + i
+            self._starts.extend(starts)
+            self._ends.extend(ends)
+
+        # entry indexes, in file order and sorted by title
+        # duplicate titles keep their first position and the data of the last entry, like a dict
+        self._order = array.array("I", titles.values())
+        self._sorted = array.array("I", (titles[title] for title in sorted(titles)))
+
+    def _scan_chunks(self, workers):
+        """ Yields the titles, start offsets and end offsets of the entries of each chunk, in file order """
+
+        if not workers or workers < 2:
+            yield self._scan_range(self._mm, 0, len(self._mm))
+            return
+
+        chunks = self._get_chunks(self._mm, workers*4)
+        with ProcessPoolExecutor(workers) as executor:
+            # map() returns the chunks in order, so duplicate titles resolve the same as a serial scan
+            yield from executor.map(self._scan_chunk, itertools.repeat(self.filename), chunks)
+
+    @classmethod
+    def _scan_chunk(cls, filename, chunk):
+        with open(filename, "rb") as infile:
+            mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls._scan_range(mm, *chunk)
+        finally:
+            mm.close()
+
+    @classmethod
+    def _scan_range(cls, mm, start, end):
+        """ Returns the titles, start offsets and end offsets of the entries between start and end """
+        titles = []
+        starts = array.array("Q")
+        ends = array.array("Q")
+        for title, entry_start, entry_end in cls._iter_offsets(mm, start, end):
+            titles.append(title)
+            starts.append(entry_start)
+            ends.append(entry_end)
+        return titles, starts, ends
+
+    @classmethod
+    def _get_chunks(cls, mm, count):
+        """ Returns a list of (start, end) byte ranges that split mm into roughly count chunks
+        Each chunk after the first starts at an entry separator """
+
+        size = len(mm)
+        boundaries = [0]
+        for i in range(1, count):
+            pos = max(size * i // count, boundaries[-1])
+            pos = cls._find_separator(mm, pos, size)[0]
+            if boundaries[-1] < pos < size:
+                boundaries.append(pos)
+
+        boundaries.append(size)
+        return list(zip(boundaries, boundaries[1:]))
+
+    @staticmethod
+    def _find_separator(mm, pos, end):
+        """ Returns the start and end of the first separator line starting at or after pos, or end, end """
+
+        # start at the beginning of the next line
+        if pos:
+            pos = mm.find(b"\n", pos-1, end) + 1 or end
+
+        while True:
+            # entry separators are lines containing only _____ and whitespace, like the dict backend
+            found = mm.find(b"_____", pos, end)
+            if found == -1:
+                return end, end
+
+            bol = mm.rfind(b"\n", 0, found) + 1
+            eol = mm.find(b"\n", found, end)
+            if eol == -1:
+                eol = end
+
+            if bol >= pos and mm[bol:eol].decode().strip() == "_____":
+                return bol, eol
+
+            pos = eol
+
+    def _load_index(self, index):
+        """ Maps the offsets saved in index, returns False if it's missing or wasn't built from the current wordlist """
+        if not os.path.exists(index):
+            return False
+
+        try:
+            with open(index, "rb") as infile:
+                mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        try:
+            magic, version, stamp, entry_count, title_count = self._index_header.unpack_from(mm)
+        except struct.error:
+            magic = version = None
+
+        if magic != self.INDEX_MAGIC or version != self.INDEX_VERSION \
+                or not SourceStamp.check(stamp, self.filename, index, self._stamp_offset):
+            mm.close()
+            return False
+
+        mv = memoryview(mm)
+        pos = self._index_header.size
+        self._starts = mv[pos:pos+entry_count*8].cast("Q")
+        pos += entry_count*8
+        self._ends = mv[pos:pos+entry_count*8].cast("Q")
+        pos += entry_count*8
+        self._order = mv[pos:pos+title_count*4].cast("I")
+        pos += title_count*4
+        self._sorted = mv[pos:pos+title_count*4].cast("I")
+        self._index_mm = mm
+
+        return True
+
+    def _write_index(self, index):
+        header = self._index_header.pack(self.INDEX_MAGIC, self.INDEX_VERSION, SourceStamp.get(self.filename),
+                len(self._starts), len(self._order))
+
+        # write to a temporary file so readers never see a partial index
+        tmpfile = f"{index}.{os.getpid()}.tmp"
+        with open(tmpfile, "wb") as outfile:
+            outfile.write(header)
+            for data in [self._starts, self._ends, self._order, self._sorted]:
+                outfile.write(data.tobytes())
+        os.replace(tmpfile, index)
+
+    @classmethod
+    def _iter_offsets(cls, mm, start, end):
+        """ Yields (title, title_offset, end_offset) for every entry between start and end """
+
+        pos = start
+        sep = None
+        while True:
+            bol, eol = cls._find_separator(mm, pos, end)
+            if bol == end:
+                break
+
+            if sep is not None:
+                yield from cls._get_entry_offsets(mm, sep, bol)
+            sep = eol + 1
+            pos = eol
+
+        if sep is not None:
+            yield from cls._get_entry_offsets(mm, sep, end)
+
+    @classmethod
+    def _get_entry_offsets(cls, mm, start, end):
+        """ Yields (title, title_offset, end_offset) if the data between start and end contains an entry """
+
+        pos = start
+        while pos < end:
+            eol = mm.find(b"\n", pos, end)
+            if eol == -1:
+                eol = end
+            line = mm[pos:eol].decode().strip()
+            if line and not line.startswith("#"):
+                # entries without any data are ignored
+                data = mm[eol:end].lstrip()
+                if data and (not data.startswith(b"#") or any(cls._iter_data(mm, eol, end))):
+                    yield line, pos, end
+                return
+            pos = eol + 1
+
+    @staticmethod
+    def _iter_data(mm, start, end):
+        # split lines the same way as reading the file in text mode
+        for line in io.StringIO(mm[start:end].decode(), newline=None):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+    def _get_title(self, idx):
+        start = self._starts[idx]
+        eol = self._mm.find(b"\n", start, self._ends[idx])
+        if eol == -1:
+            eol = self._ends[idx]
+        return self._mm[start:eol].decode().strip()
+
+    def _get_lines(self, idx):
+        lines = self._iter_data(self._mm, self._starts[idx], self._ends[idx])
+        next(lines) # title
+        return list(lines)
+
+    def _find(self, title):
+        """ Returns the index of the entry with the given title or None """
+        if not isinstance(title, str):
+            return None
+
+        lo = 0
+        hi = len(self._sorted)
+        while lo < hi:
+            mid = (lo+hi)//2
+            idx = self._sorted[mid]
+            mid_title = self._get_title(idx)
+            if mid_title == title:
+                return idx
+            if mid_title < title:
+                lo = mid+1
+            else:
+                hi = mid
+
+    def __getitem__(self, title):
+        idx = self._find(title)
+        if idx is None:
+            raise KeyError(title)
+        return self._get_lines(idx)
+
+    def __contains__(self, title):
+        return self._find(title) is not None
+
+    def __iter__(self):
+        for idx in self._order:
+            yield self._get_title(idx)
+
+    def __len__(self):
+        return len(self._order)
+
+    def items(self):
+        for idx in self._order:
+            yield self._get_title(idx), self._get_lines(idx)
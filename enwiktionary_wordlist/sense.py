@@ -3,9 +3,39 @@ import sys
 
 from .example import Example
 
+def make_trie_pattern(words):
+    """ Returns a regex pattern matching any of the given words, with common prefixes
+    factored into a trie so the regex engine doesn't need to try every word in turn """
+
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[""] = {}
+
+    def node_pattern(node):
+        end = "" in node
+        alts = [re.escape(c) + node_pattern(child) for c, child in sorted(node.items()) if c]
+        if not alts:
+            return ""
+        pattern = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return node_pattern(trie)
+
 class Sense():
+
+    __slots__ = ("depth", "gloss", "qualifier", "usage", "id", "_regiondata", "_regions", "_nymdata", "_nyms",
+            "examples", "subsenses", "formtype", "lemma", "nonform")
+
     def __init__(self, data, depth=1): # pos, qualifier, gloss, syndata):
+        self._init(depth)
+        self._parse(data, 0)
 
+    def _init(self, depth):
         assert depth > 0
         self.depth = depth
         self.gloss = None
@@ -14,18 +44,24 @@ class Sense():
         self.id = None
         self._regiondata = None
         self._regions = None
-        self._nymdata = []
-        self._nyms = []
+        # allocated when the first nym is added
+        self._nymdata = None
+        self._nyms = None
         self.examples = []
         self.subsenses = []
 
+    def _parse(self, data, idx):
+        """ Parse the sense starting at data[idx]
+        Returns the index of the first item that isn't part of this sense """
+
+        depth = self.depth
         gloss = "_" * (depth-1) + "gloss"
         subsense = "_" + gloss
         prev = ["_" * p + "gloss"  for p in range(depth-1)]
 
-        while(data):
-            item = data.pop(0)
-            key, value = item
+        end = len(data)
+        while idx < end:
+            key, value = data[idx]
             if key == gloss:
                 if depth == 1:
                     assert self.gloss == None
@@ -33,25 +69,27 @@ class Sense():
                 else:
                     if self.gloss == None:
                         self.gloss = value
-                    # Start of a new subsense, repair the stack and return
+                    # Start of a new subsense
                     else:
-                        data.insert(0, item)
                         break
             elif key == subsense:
-                # new subsense, repair the stack
-                data.insert(0, item)
-                self.subsenses.append(Sense(data, depth+1))
-            elif key in prev: # start of a new sense, repair the stack and return
-                data.insert(0, item)
+                sense = type(self).__new__(type(self))
+                sense._init(depth+1)
+                idx = sense._parse(data, idx)
+                self.subsenses.append(sense)
+                continue
+            elif key in prev: # start of a new sense
                 break
             elif key == "ex":
-                data.insert(0, item)
-                self.parse_examples(data)
+                idx = self.parse_examples(data, idx)
+                continue
             elif key == "id":
                 self.id = value
             elif key == "usage":
                 self.usage.append(value)
             elif key in ["syn", "ant"]:
+                if self._nymdata is None:
+                    self._nymdata = []
                 self._nymdata.append((key, value))
             elif key == "q":
                 # "q" before nymdata applies to the gloss
@@ -64,15 +102,22 @@ class Sense():
                 self._regiondata = value
             else:
                 raise ValueError(f"Unexpected data: {key}, {value}")
+            idx += 1
 
         self.formtype, self.lemma, self.nonform = self.parse_form_of(self.gloss)
         if self.lemma:
             self.lemma = self.lemma.strip()
 
-    def parse_examples(self, data):
+        return idx
+
+    def parse_examples(self, data, idx=0):
+        """ Parse the examples starting at data[idx]
+        Returns the index of the first item that isn't part of an example """
+
         ex_data = []
-        while data:
-            item = data.pop(0)
+        end = len(data)
+        while idx < end:
+            item = data[idx]
             key, value = item
             if key == "ex":
                 if ex_data:
@@ -81,10 +126,11 @@ class Sense():
             elif key in ["eng", "src"]:
                 ex_data.append(item)
             else:
-                data.insert(0, item)
                 break
+            idx += 1
         if ex_data:
             self.add_example(ex_data)
+        return idx
 
     def add_example(self, ex_data):
         self.examples.append(Example(ex_data))
@@ -92,6 +138,7 @@ class Sense():
     @property
     def nyms(self):
         if self._nymdata:
+            self._nyms = []
             nymtype = None
             qualifier = None
             nyms = []
@@ -112,7 +159,7 @@ class Sense():
                 self._nyms.append((nymtype, qualifier, nyms))
 
             self._nymdata = None
-        return self._nyms
+        return self._nyms if self._nyms is not None else []
 
     @property
     def regions(self):
@@ -134,22 +181,26 @@ class Sense():
 
         returns tuple (formtype, lemma, remaining_definition)
         """
-        res = re.search(cls.form_pattern, definition)
+        # Both patterns require " of " or " in " following the prefix, skip the regex if neither is present
+        if " of " not in definition and " in " not in definition:
+            return (None,None,None)
+
+        res = cls._form_regex.search(definition) if ' of "' in definition or ' in "' in definition else None
 
         if res:
             formtype = cls.form_of_prefix.get(res.group(1), res.group(1))
             lemma = res.group(2)
-            nonform = re.sub(re.escape(res.group(0)), "", definition).strip()
+            nonform = definition.replace(res.group(0), "").strip()
             if res.group(1) == "compound form":
-                nonform = re.sub(r'^([+]".*?")*', "", nonform)
+                nonform = cls._compound_form_regex.sub("", nonform)
             return (formtype, lemma, nonform)
 
-        res = re.search(cls.alt_form_pattern, definition)
+        res = cls._alt_form_regex.search(definition)
         if res:
             print(f"Found non-template form of: {definition}", file=sys.stderr)
             formtype = cls.form_of_prefix[res.group(1)]
             lemma = res.group(2)
-            nonform = re.sub(re.escape(res.group(0)), "", definition).strip()
+            nonform = definition.replace(res.group(0), "").strip()
             return (formtype, lemma, nonform)
 
         return (None,None,None)
@@ -212,8 +263,16 @@ class Sense():
         r"(?:gerund|pp|cond|fut|infinitive|imp|impf|neg_imp|pres|pret)_\w+": "1", # patern matches will always be themselves
     }
 
+    _prefix_patterns = [k for k in form_of_prefix if "\\" in k]
+    _prefix_words = [k for k in form_of_prefix if "\\" not in k]
+
     alt_form_pattern = r"(?:^|A |An |\(|[,;:\)] )(" + "|".join(form_of_prefix.keys()) + r") (?:of|in) ([^,;:()]*)[,;:()]?"
+    _alt_form_regex = re.compile(r"(?:^|A |An |\(|[,;:\)] )(" + "|".join([make_trie_pattern(_prefix_words)] + _prefix_patterns) + r") (?:of|in) ([^,;:()]*)[,;:()]?")
 
     # Add "form" after the alt form pattern is generated so it doesn't warn on every literal string with the phrase "form of xxx"
     form_of_prefix["form"] = "alt"
+    _prefix_words.append("form")
     form_pattern = r"(?:^|A |An |\(|[,;:\)] )(" + "|".join(form_of_prefix.keys()) + r') (?:of|in) "([^"]*)"'
+    _form_regex = re.compile(r"(?:^|A |An |\(|[,;:\)] )(" + "|".join([make_trie_pattern(_prefix_words)] + _prefix_patterns) + r') (?:of|in) "([^"]*)"')
+
+    _compound_form_regex = re.compile(r'^([+]".*?")*')
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import struct
+
+class SourceStamp():
+    """ Size, mtime and content hash of the file an index was built from, stored in the index header
+
+    The size and mtime are checked first, the content hash is only checked if the mtime
+    differs so copied or touched files with the same content are still recognized
+    """
+
+    # source size, source mtime, source sha1
+    _struct = struct.Struct("=QQ20sxxxx")
+    size = _struct.size
+
+    # offset of the mtime in a stamp
+    _mtime = struct.Struct("=Q")
+    _mtime_offset = _mtime.size
+
+    @classmethod
+    def get(cls, source):
+        """ Returns the stamp of source, or a stamp that never matches if source is None """
+        if source is None:
+            return bytes(cls.size)
+        stat = os.stat(source)
+        return cls._struct.pack(stat.st_size, stat.st_mtime_ns, cls.hash_file(source))
+
+    @classmethod
+    def check(cls, stamp, source, filename, offset):
+        """ Returns True if stamp matches the current content of source
+
+        stamp is stored at offset in filename, if only the mtime of source changed the stored
+        mtime is updated so later checks don't need to hash source again
+        """
+        source_size, source_mtime, source_hash = cls._struct.unpack(stamp)
+
+        stat = os.stat(source)
+        if stat.st_size != source_size:
+            return False
+
+        if stat.st_mtime_ns == source_mtime:
+            return True
+
+        if cls.hash_file(source) != source_hash:
+            return False
+
+        try:
+            with open(filename, "r+b") as outfile:
+                outfile.seek(offset + cls._mtime_offset)
+                outfile.write(cls._mtime.pack(stat.st_mtime_ns))
+        except OSError:
+            # read-only index, it's still valid
+            pass
+
+        return True
+
+    @staticmethod
+    def hash_file(filename):
+        sha1 = hashlib.sha1()
+        with open(filename, "rb") as infile:
+            for block in iter(lambda: infile.read(1<<20), b""):
+                sha1.update(block)
+        return sha1.digest()
@@ -0,0 +1,183 @@
+import array
+import mmap
+import os
+import struct
+import tempfile
+
+from collections.abc import Mapping
+
+from .source_stamp import SourceStamp
+
+class TranscludesIndex(Mapping):
+    """ Read-only { (word, senseid): sense } mapping backed by a memory-mapped index file
+
+    Processes opening the same index share its pages through the page cache, so worker
+    processes don't each need a copy of the transcluded senses
+
+    File layout (native byte order):
+        header
+        offsets   u64 * (count*2+1), start of each key and value in data, followed by the end of the data
+        data      utf-8 "word\\0senseid" key and sense value of each record, sorted by key
+    """
+
+    MAGIC = b"WLTRANS\0"
+    VERSION = 1
+
+    # magic, version, source stamp, record count
+    _header = struct.Struct(f"=8sIxxxx{SourceStamp.size}sQ")
+    _stamp_offset = struct.calcsize("=8sIxxxx")
+
+    def __init__(self, filename):
+        self.filename = filename
+        # set for temporary indexes built by from_file
+        self._remove_on_close = False
+        with open(filename, "rb") as infile:
+            self._mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, self._stamp, self._count = self._header.unpack_from(self._mm)
+        except struct.error:
+            magic = version = None
+
+        if magic != self.MAGIC or version != self.VERSION:
+            self._mm.close()
+            raise ValueError("Unsupported transcludes index", filename)
+
+        offsets_start = self._header.size
+        self._data = offsets_start + (self._count*2+1)*8
+        self._offsets = memoryview(self._mm)[offsets_start:self._data].cast("Q")
+
+    def close(self):
+        self._offsets.release()
+        self._mm.close()
+        if self._remove_on_close:
+            os.remove(self.filename)
+
+    @classmethod
+    def is_index(cls, filename):
+        with open(filename, "rb") as infile:
+            return infile.read(len(cls.MAGIC)) == cls.MAGIC
+
+    @classmethod
+    def from_file(cls, filename):
+        """ Opens filename if it is an index, otherwise filename is read as a transcludes file
+        and converted to a .idx sidecar file that is reused until the transcludes file changes
+
+        If the sidecar can't be written, the index is built in a temporary file that is
+        removed when the index is closed """
+
+        if cls.is_index(filename):
+            return cls(filename)
+
+        cached = filename + ".idx"
+        if os.path.exists(cached):
+            try:
+                index = cls(cached)
+            except ValueError:
+                index = None
+
+            if index:
+                if index.is_valid(filename):
+                    return index
+                index.close()
+
+        try:
+            with open(filename) as infile:
+                cls.write(cached, cls.iter_transcludes(infile), filename)
+        except OSError:
+            # read-only directory
+            return cls._from_temp_file(filename)
+        return cls(cached)
+
+    @classmethod
+    def _from_temp_file(cls, source):
+        """ Returns an index of the transcludes file source, stored in a temporary file """
+        fd, tmpfile = tempfile.mkstemp(suffix=".idx")
+        os.close(fd)
+        try:
+            with open(source) as infile:
+                cls.write(tmpfile, cls.iter_transcludes(infile), source)
+            index = cls(tmpfile)
+        except Exception:
+            os.remove(tmpfile)
+            raise
+        index._remove_on_close = True
+        return index
+
+    def is_valid(self, source):
+        """ Returns True if the index was built from the current content of the transcludes file source """
+        return SourceStamp.check(self._stamp, source, self.filename, self._stamp_offset)
+
+    @staticmethod
+    def iter_transcludes(lines):
+        """ Yields (word, senseid), sense for each line of a transcludes file """
+        for l in lines:
+            word, senseid, _, sense = l.split(":", 3)
+            yield (word, senseid), sense.strip()
+
+    @classmethod
+    def write(cls, filename, items, source=None):
+        """ Write the (word, senseid), sense pairs from items to an index file
+        source is the name of the transcludes file the items were read from """
+
+        # duplicate keys use the last value, like a dict
+        records = {cls._make_key(*key): value.encode() for key, value in items}
+
+        offsets = array.array("Q")
+        data = bytearray()
+        for key in sorted(records):
+            offsets.append(len(data))
+            data += key
+            offsets.append(len(data))
+            data += records[key]
+        offsets.append(len(data))
+
+        # write to a temporary file so readers never see a partial index
+        tmpfile = f"{filename}.{os.getpid()}.tmp"
+        with open(tmpfile, "wb") as outfile:
+            outfile.write(cls._header.pack(cls.MAGIC, cls.VERSION, SourceStamp.get(source), len(records)))
+            outfile.write(offsets.tobytes())
+            outfile.write(data)
+        os.replace(tmpfile, filename)
+
+    @staticmethod
+    def _make_key(word, senseid):
+        return f"{word}\0{senseid}".encode()
+
+    def _get_bytes(self, idx):
+        return self._mm[self._data+self._offsets[idx]:self._data+self._offsets[idx+1]]
+
+    def _find(self, key):
+        """ Returns the record number of the given key or None """
+        if not isinstance(key, tuple) or len(key) != 2:
+            return None
+
+        value = self._make_key(*key)
+        lo = 0
+        hi = self._count
+        while lo < hi:
+            mid = (lo+hi)//2
+            mid_value = self._get_bytes(mid*2)
+            if mid_value == value:
+                return mid
+            if mid_value < value:
+                lo = mid+1
+            else:
+                hi = mid
+
+    def __getitem__(self, key):
+        idx = self._find(key)
+        if idx is None:
+            raise KeyError(key)
+        return self._get_bytes(idx*2+1).decode()
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __iter__(self):
+        for idx in range(self._count):
+            word, senseid = self._get_bytes(idx*2).decode().split("\0")
+            yield word, senseid
+
+    def __len__(self):
+        return self._count
@@ -48,7 +48,34 @@ def make_pos_tag(word, qualifiers):
 
     return "{" + pos + "}"
 
+# Characters that can start markup handled by wiki_to_text, text without any of them is returned unchanged
+_markup_chars = "{[<'&"
+
+_re_unterminated_comment = re.compile(r"<!--.*")
+_re_bold_italic = re.compile(r"(''''')(.*?)\1", flags=re.DOTALL)
+_re_bold = re.compile(r"(''')(.*?)\1", flags=re.DOTALL)
+_re_italic = re.compile(r"('')(.*?)\1", flags=re.DOTALL)
+
+_html_cleanup = [
+    # convert numbers like 10<sup>-8</sup> to 10^-8
+    (re.compile(r"<sup>([-\d.\s]*)</sup>", flags=re.DOTALL), r"^\1"),
+    (re.compile(r"<\s*(code|div|i|nowiki|sub|sup|small)\s*>(.*?)<\s*/\s*\1\s*>", flags=re.DOTALL), r"\2"),
+    (re.compile(r"<\s*blockquote.*?>(.*?)<\s*/\s*blockquote\s*>", flags=re.DOTALL), r"\1"),
+    (re.compile(r"<ref [^>]*/>", flags=re.DOTALL), ""),
+    (re.compile(r"<ref(.*?)</ref>", flags=re.DOTALL), ""),
+    (re.compile(r"<br\s*(/)?\s*>", flags=re.DOTALL), "\n"),
+    (re.compile(r"<ref>.*", flags=re.DOTALL), ""),
+]
+
+_entities = { "&nbsp;": " ", "&ndash;": "-" }
+_re_entities = re.compile("|".join(_entities))
+
 def wiki_to_text( wikitext, title, transclude_senses={}, template_cachedb=None):
+
+    # Fast path for text without any markup
+    if isinstance(wikitext, str) and not any(c in wikitext for c in _markup_chars):
+        return wikitext
+
     wiki = mwparser.parse(wikitext)
 
     # Remove comments
@@ -72,25 +99,24 @@ def wiki_to_text( wikitext, title, transclude_senses={}, template_cachedb=None):
     for comment in wiki.ifilter_comments():
         wiki.remove(comment)
     # Also remove any unterminated comments
-    res = re.sub(r"<!--.*", "", str(wiki))
+    res = _re_unterminated_comment.sub("", str(wiki))
 
     for old, new in replacements:
         res = res.replace(old, new)
 
-    res = re.sub(r"(''''')(.*?)\1", r"\2", res, flags=re.DOTALL)
-    res = re.sub(r"(''')(.*?)\1", r"\2", res, flags=re.DOTALL)
-    res = re.sub(r"('')(.*?)\1", r"\2", res, flags=re.DOTALL)
+    # Each cleanup pass is skipped if the text doesn't contain the characters it matches
+    if "''" in res:
+        res = _re_bold_italic.sub(r"\2", res)
+        res = _re_bold.sub(r"\2", res)
+        res = _re_italic.sub(r"\2", res)
+
+    if "<" in res:
+        for pattern, replacement in _html_cleanup:
+            res = pattern.sub(replacement, res)
+
+    if "&" in res:
+        res = _re_entities.sub(lambda m: _entities[m.group(0)], res)
 
-    # convert numbers like 10<sup>-8</sup> to 10^-8
-    res = re.sub(r"<sup>([-\d.\s]*)</sup>", r"^\1", res, flags=re.DOTALL)
-    res = re.sub(r"<\s*(code|div|i|nowiki|sub|sup|small)\s*>(.*?)<\s*/\s*\1\s*>", r"\2", res, flags=re.DOTALL)
-    res = re.sub(r"<\s*blockquote.*?>(.*?)<\s*/\s*blockquote\s*>", r"\1", res, flags=re.DOTALL)
-    res = re.sub(r"<ref [^>]*/>", "", res, flags=re.DOTALL)
-    res = re.sub(r"<ref(.*?)</ref>", "", res, flags=re.DOTALL)
-    res = re.sub(r"<br\s*(/)?\s*>", "\n", res, flags=re.DOTALL)
-    res = re.sub(r"<ref>.*", "", res, flags=re.DOTALL)
-    res = re.sub(r"&nbsp;", " ", res)
-    res = re.sub(r"&ndash;", "-", res)
     return res
 
 
@@ -19,15 +19,18 @@ shorten_formtype = {
 
 class Word():
 
+    __slots__ = ("parent", "word", "_pos", "_forms", "_form_of", "_sense_data", "_senses", "meta", "_meta_parsed",
+            "genders", "qualifier", "etymology", "use_notes", "headline")
+
     def __init__(self, parent, word, data):
 
         self.parent = parent
         self.word = word
         self._pos = None
-        # accessed as .forms
-        self._forms = defaultdict(list) # { formtype: [form1, ..] }
-        # accessed as .form_of
-        self._form_of = defaultdict(list) # { lemma: [formtype1, formtype2 ..] }
+        # accessed as .forms, allocated when the first form is added
+        self._forms = None # { formtype: [form1, ..] }
+        # accessed as .form_of, allocated when the first lemma is added
+        self._form_of = None # { lemma: [formtype1, formtype2 ..] }
         self._sense_data = None
         self._senses = None
         self.meta = None
@@ -76,6 +79,9 @@ class Word():
         if self.pos == "v" and " " in form:
             form = re.sub(f"(^|[|])(?:no )?(?:(?:me|te|se|nos|os) )?", r'\1', form)
 
+        if self._forms is None:
+            self._forms = defaultdict(list)
+
         if form not in self._forms[formtype]:
             self._forms[formtype].append(form)
 
@@ -91,8 +97,14 @@ class Word():
                yield formtype
 
     def add_lemma(self, lemma, formtype):
-        if formtype not in self.form_of[lemma]:
-            self.form_of[lemma].append(formtype)
+        self._parse_meta()
+        self._parse_sense_data()
+
+        if self._form_of is None:
+            self._form_of = defaultdict(list)
+
+        if formtype not in self._form_of[lemma]:
+            self._form_of[lemma].append(formtype)
 
     @staticmethod
     def parse_list(line):
@@ -180,7 +192,7 @@ class Word():
             self._meta_parsed = True
             self.add_forms_from_meta()
 
-            if self.genders == "fp":
+            if self.genders == "fp" and self._forms:
                 for form in self._forms.get("mpl", []):
                     self.add_lemma(form, "fpl")
 
@@ -188,12 +200,12 @@ class Word():
     def form_of(self):
         self._parse_meta()
         self._parse_sense_data()
-        return self._form_of
+        return self._form_of if self._form_of is not None else {}
 
     @property
     def forms(self):
         self._parse_meta()
-        return self._forms
+        return self._forms if self._forms is not None else {}
 
     def has_form(self, form, formtype=None):
         if formtype:
@@ -1,9 +1,11 @@
 import itertools
-import os
-import pickle
 import re
 import sys
 
+from collections import OrderedDict
+
+from .entry_cache import EntryCache
+from .mmap_entries import MmapEntries
 from .word import Word
 
 from enwiktionary_wordlist.utils import wiki_to_text
@@ -17,10 +19,18 @@ verb_types = {
 }
 
 class Wordlist():
-    def __init__(self, wordlist_data=None, cache_words=True):
+    def __init__(self, wordlist_data=None, cache_words=True, cache_size=None):
         # cache here refers to caching word objects in memory to speed up repeat access
+        # if cache_size is set, only the most recently used cache_size entries are kept
+        # and evicted entries will be parsed again from their source lines
         self.cache_words = cache_words
-        self._cached = {}
+        self.cache_size = cache_size
+        self._cached = OrderedDict() if cache_size else {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        # optional ExpansionCache used by expand_templates
+        self.expansion_cache = None
         if not wordlist_data:
             self.all_entries = {}
             return
@@ -36,19 +46,45 @@ class Wordlist():
             self.all_entries = {title: entry for title, entry in self._iter_entries(iter_data)}
 
     @classmethod
-    def from_file(cls, filename, cache_words=True):
+    def from_file(cls, filename, cache_words=True, backend=None, cache_size=None, workers=None):
+        """ Loads a wordlist from filename
+
+        By default, the entries are stored in a binary cache file alongside the wordlist
+        and later loads will read entries from the cache as they're requested
+        backend="mmap" memory-maps the file and only parses entries when they're requested,
+        the entry offsets are saved in an index file alongside the wordlist for later loads
+        backend="dict" reads the file into memory without using a cache file
+
+        If workers is set, the mmap backend scans for entry offsets with a pool of worker
+        processes, workers can't be used with the other backends
+        """
+        if workers and backend != "mmap":
+            raise ValueError("workers requires backend='mmap'", backend)
+
+        if backend == "mmap":
+            res = cls(cache_words=cache_words, cache_size=cache_size)
+            res.all_entries = MmapEntries(filename, workers=workers)
+            return res
+
+        elif backend == "dict":
+            with open(filename) as infile:
+                return cls(infile, cache_words, cache_size)
+
+        elif backend:
+            raise ValueError("Unknown backend", backend)
+
         # check for cached version
         cached = filename + ".~db"
-        if os.path.exists(cached) and os.path.getctime(cached) > os.path.getctime(filename):
-            with open(cached, "rb") as infile:
-                res = pickle.load(infile)
+        entries = EntryCache.open(cached, filename)
+        if entries is not None:
+            res = cls(cache_words=cache_words, cache_size=cache_size)
+            res.all_entries = entries
             return res
 
         with open(filename) as infile:
-            res = cls(infile, cache_words)
-            with open(cached, "wb") as outfile:
-                pickle.dump(res, outfile)
-            return res
+            res = cls(infile, cache_words, cache_size)
+        EntryCache.write(cached, filename, res.all_entries.items())
+        return res
 
     @staticmethod
     def _iter_entries(data):
@@ -189,23 +225,46 @@ class Wordlist():
             return []
 
         if self.cache_words:
-            if title not in self._cached:
-                self._cached[title] = tuple(self._get_iwords(title))
-
-                # Delete the source lines from all_entries
-                if title in self.all_entries:
-                    self.all_entries[title] = None
-                    # don't delete the entry, it breaks iteration in allforms
+            words = self._cached.get(title)
+            if words is None:
+                self.cache_misses += 1
+                words = tuple(self._get_iwords(title))
+                self._add_cached(title, words)
+            else:
+                self.cache_hits += 1
+                if self.cache_size:
+                    self._cached.move_to_end(title)
 
-            for word in self._cached[title]:
+            for word in words:
                 if not pos or pos == word.pos:
                     yield word
 
         else:
             yield from self._get_iwords(title, pos)
 
+    def _add_cached(self, title, words):
+        self._cached[title] = words
+
+        if self.cache_size:
+            if len(self._cached) > self.cache_size:
+                self._cached.popitem(last=False)
+                self.cache_evictions += 1
+
+        # Delete the source lines from all_entries
+        # (mmap and cache backed entries don't hold the lines in memory)
+        elif isinstance(self.all_entries, dict):
+            self.all_entries[title] = None
+            # don't delete the entry, it breaks iteration in allforms
+
     def _get_iwords(self, word, pos=None):
-        return self.get_entry_words(word, self.all_entries.get(word,[]), pos)
+        lines = self.all_entries.get(word,[])
+
+        # Entries added as iterators can only be read once, keep a copy
+        # so they can be parsed again if they're not cached
+        if lines is not None and not isinstance(lines, list):
+            lines = self.all_entries[word] = list(lines)
+
+        return self.get_entry_words(word, lines, pos)
 
     def get_formtypes(self, lemma, pos, form):
         """ Returns the possible formtypes of a given form in lemma,pos """
@@ -213,39 +272,58 @@ class Wordlist():
             yield from word.get_formtypes(form)
 
     def expand_templates(self, text, title):
-        return wiki_to_text(text, title).strip()
+        if self.expansion_cache:
+            return self.expansion_cache.expand(text, title, self._expand_templates)
+        return self._expand_templates(text, title)
 
     @staticmethod
-    def parse_line(line):
-        """ Parse dictionary lines:
-        word {pos-forms} :: formtype=form; formtype2=form2
-        word {pos} | syn1; syn2 :: [qualifiers] gloss
-        absolver {verb-forms} :: pattern=-olver; stem=abs
-        """
+    def _expand_templates(text, title):
+        return wiki_to_text(text, title).strip()
 
-        pattern = r"""(?x)
-             (?P<word>[^{:]+)             # The word (anything not an opening brace)
+    _mbformat_pattern = re.compile(r"""(?x)
+         (?P<word>[^{:]+)             # The word (anything not an opening brace)
 
-             ([ ]{                        # (optional) a space
-               (?P<pos>[^}]*)             #    and then the the part of speech, enclosed in curly braces
-             \})*                         #    (this may be specified more than once, the last one wins)
+         ([ ]{                        # (optional) a space
+           (?P<pos>[^}]*)             #    and then the the part of speech, enclosed in curly braces
+         \})*                         #    (this may be specified more than once, the last one wins)
 
-             ([ ]\[                       # (optional) a space
-               (?P<note>[^\]]*)           #    and then the note, enclosed in square brackets
-             \])?
+         ([ ]\[                       # (optional) a space
+           (?P<note>[^\]]*)           #    and then the note, enclosed in square brackets
+         \])?
 
-             (?:[ ][|][ ]                    # (optional) a space and then a pipe | and a space
-               (?P<syn>.*?)                #    and then a list of synonyms
-             )?
+         (?:[ ][|][ ]                    # (optional) a space and then a pipe | and a space
+           (?P<syn>.*?)                #    and then a list of synonyms
+         )?
 
-             (                            # this whole bit can be optional
-               [ ]*::[ ]                  #   :: optionally preceded by whitespace and followed by a mandatory space
+         (                            # this whole bit can be optional
+           [ ]*::[ ]                  #   :: optionally preceded by whitespace and followed by a mandatory space
 
-               (?P<def>.*)                #   the definition
-             )?
-             \n?$                         # an optional newline at the end
+           (?P<def>.*)                #   the definition
+         )?
+         \n?$                         # an optional newline at the end
+    """)
+
+    @classmethod
+    def parse_line(cls, line):
+        """ Parse dictionary lines:
+        word {pos-forms} :: formtype=form; formtype2=form2
+        word {pos} | syn1; syn2 :: [qualifiers] gloss
+        absolver {verb-forms} :: pattern=-olver; stem=abs
         """
-        res = re.match(pattern, line)
+
+        # Fast path for the common "word {pos} :: definition" lines without notes or synonyms
+        head, sep, definition = line.partition(" :: ")
+        if sep and head.endswith("}"):
+            brace = head.find(" {")
+            if brace > 0:
+                word = head[:brace]
+                pos = head[brace+2:-1]
+                if definition.endswith("\n"):
+                    definition = definition[:-1]
+                if "{" not in word and ":" not in word and "}" not in pos and "\n" not in definition:
+                    return (word.strip(), pos, '', '', definition)
+
+        res = cls._mbformat_pattern.match(line)
         if not res:
             raise ValueError("Cannot parse", line)
 
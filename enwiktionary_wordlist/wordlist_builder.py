@@ -29,20 +29,23 @@ import sys
 import enwiktionary_sectionparser as sectionparser
 
 from enwiktionary_wordlist.utils import wiki_to_text, make_pos_tag
+from enwiktionary_wordlist.transcludes_index import TranscludesIndex
 
 class WordlistBuilder:
-    def __init__(self, lang_name, lang_id, transcludes_filename=None, expand_templates=False, generate_meta=False):
+    def __init__(self, lang_name, lang_id, transcludes_filename=None, expand_templates=False, generate_meta=False, transclude_senses=None):
+        """ transclude_senses may be a { (word, senseid): sense } mapping, like a TranscludesIndex,
+        to use instead of reading transcludes_filename """
         self.LANG_SECTION = lang_name
         self.LANG_ID = lang_id
         self._expand_templates = expand_templates
         self._generate_meta = generate_meta
 
         self._transclude_senses = {}
-        if transcludes_filename:
+        if transclude_senses is not None:
+            self._transclude_senses = transclude_senses
+        elif transcludes_filename:
             with open(transcludes_filename) as infile:
-                for l in infile:
-                    word, senseid, _, sense = l.split(":", 3)
-                    self._transclude_senses[(word,senseid)] = sense.strip()
+                self._transclude_senses.update(TranscludesIndex.iter_transcludes(infile))
 
         start = fr"(^|\n)==\s*{self.LANG_SECTION}\s*==\s*\n"
         re_endings = [ r"\[\[\s*Category\s*:", r"==[^=]+==", r"----" ]
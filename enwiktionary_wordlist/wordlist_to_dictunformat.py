@@ -2,21 +2,58 @@
 
 import csv
 import collections
+import hashlib
 import html
+import multiprocessing
 import os
 import re
 import sys
+import time
 
 from enwiktionary_wordlist.wordlist import Wordlist
 from enwiktionary_wordlist.all_forms import AllForms
 
+# converter used by export() worker processes, inherited when the workers are forked
+_converter = None
+
+def _init_worker(converter):
+    global _converter
+    _converter = converter
+
+    # the expansion cache database belongs to the parent process
+    if converter.wordlist.expansion_cache:
+        converter.wordlist.expansion_cache.detach()
+
+def _build_entry(page):
+    """ Returns the rendered entry and the highlight stats collected while rendering it """
+    primary, targets = page
+    entry = _converter.build_entry(primary, targets)
+    return entry, _converter.pop_highlight_stats()
+
 class WordlistToDictunformat():
 
+    # maximum number of compiled highlight patterns kept by get_highlight_pattern
+    HIGHLIGHT_CACHE_SIZE = 1000
+
+    # highlight counters, summed from the workers when export() renders pages in other processes
+    HIGHLIGHT_STATS = ("highlight_cache_hits", "highlight_cache_misses", "highlight_pattern_time", "highlight_time")
+
     def __init__(self, wordlist, allforms=None, unordered=False):
         self.wordlist = wordlist
         self.allforms = allforms if allforms else AllForms.from_wordlist(wordlist)
         self.unordered = unordered
 
+        # (word, pos) -> (compiled pattern, highlight targets), least recently used first
+        self._highlight_patterns = collections.OrderedDict()
+        self.highlight_cache_hits = 0
+        self.highlight_cache_misses = 0
+        # seconds spent building patterns and highlighting examples
+        self.highlight_pattern_time = 0
+        self.highlight_time = 0
+
+        # title -> True if the entry contains a lemma
+        self._lemma_titles = {}
+
     formtypes = {
         "pl": "pl",
         "m": "m",
@@ -56,16 +93,22 @@ class WordlistToDictunformat():
             return False
         return True
 
+    def has_lemma_word(self, title):
+        """ Returns True if any of the words in the title's entry is a lemma, results are cached """
+        res = self._lemma_titles.get(title)
+        if res is None:
+            res = self._lemma_titles[title] = any(self.is_lemma(w) for w in self.wordlist.get_iwords(title))
+        return res
+
     def get_primary_word(self, words):
         """ Returns the first item in a list that is a lemma
-        If nothing found, returns the first word in the list
+        If nothing found, returns the first word in the sorted list
         """
         for word in words:
-            if any(self.is_lemma(w) for w in self.wordlist.get_words(word)):
+            if self.has_lemma_word(word):
                 return word
 
-        words.sort()
-        return words[0]
+        return min(words)
 
     def format_word(self, word_obj):
         items = []
@@ -126,18 +169,59 @@ class WordlistToDictunformat():
         return res
 
 
-    def format_sense_data(self, word_obj, sense):
+    def pop_highlight_stats(self):
+        """ Returns the highlight counters and resets them to zero """
+        stats = tuple(getattr(self, name) for name in self.HIGHLIGHT_STATS)
+        for name in self.HIGHLIGHT_STATS:
+            setattr(self, name, 0)
+        return stats
 
+    def add_highlight_stats(self, stats):
+        for name, value in zip(self.HIGHLIGHT_STATS, stats):
+            setattr(self, name, getattr(self, name) + value)
+
+    def get_highlight_pattern(self, word_obj):
+        """ Returns the compiled pattern matching the forms of word_obj and the list of forms """
+
+        key = (word_obj.word, word_obj.pos)
+        res = self._highlight_patterns.get(key)
+        if res is not None:
+            self.highlight_cache_hits += 1
+            self._highlight_patterns.move_to_end(key)
+            return res
+
+        self.highlight_cache_misses += 1
+        start = time.perf_counter()
+
+        highlight_targets = self.get_highlight_targets(word_obj)
+        pattern = r"\b(" + "|".join(map(re.escape, sorted(highlight_targets, key=lambda x: (len(x)*-1,x)))) + r")\b"
+        res = (re.compile(pattern, flags=re.IGNORECASE), highlight_targets)
+
+        self._highlight_patterns[key] = res
+        if len(self._highlight_patterns) > self.HIGHLIGHT_CACHE_SIZE:
+            self._highlight_patterns.popitem(last=False)
+
+        self.highlight_pattern_time += time.perf_counter() - start
+        return res
+
+    def get_highlight_targets(self, word_obj):
+        """ Returns the forms of word_obj that are highlighted in its examples """
         word = word_obj.word
         # use -r verb forms if there are no forms for -rse verb
         if word_obj.pos == "v" and word_obj.word.endswith("rse") and not self.allforms.has_lemma(word):
-            highlight_targets = self.allforms.get_lemma_forms(word[:-2], "v")
-        else:
-            highlight_targets = self.allforms.get_lemma_forms(word, word_obj.pos)
+            return self.allforms.get_lemma_forms(word[:-2], "v")
+        return self.allforms.get_lemma_forms(word, word_obj.pos)
+
+    def format_sense_data(self, word_obj, sense):
+
+        word = word_obj.word
 
-        pattern = r"\b(" + "|".join(map(re.escape, sorted(highlight_targets, key=lambda x: (len(x)*-1,x)))) + r")\b"
         def highlight(text):
-            new_text = re.sub(pattern, r"<b>\1</b>", text, flags=re.IGNORECASE)
+            pattern, highlight_targets = self.get_highlight_pattern(word_obj)
+
+            start = time.perf_counter()
+            new_text = pattern.sub(r"<b>\1</b>", text)
+            self.highlight_time += time.perf_counter() - start
 
             if new_text == text and word not in ["bueno"]:
                 print("no highlighting", [word, word_obj.pos, text, highlight_targets], file=sys.stderr)
@@ -416,7 +500,54 @@ class WordlistToDictunformat():
             prev_form = form
         yield [prev_form, prev_pos] + lemmas
 
-    def export(self, verbose=False):
+    def get_page_fingerprint(self, primary, targets):
+        """ Returns a hash of the data used by build_entry(primary, targets)
+
+        This includes the entries of the targets and of the lemmas they're forms of,
+        and the forms used to highlight the examples of those words """
+
+        sha1 = hashlib.sha1()
+        def add(*values):
+            for value in values:
+                sha1.update(str(value).encode())
+                sha1.update(b"\0")
+
+        add(self.unordered, primary, *(x for target in targets for x in target))
+
+        titles = {}
+        words = []
+        for title, pos in targets:
+            titles[title] = None
+            for word in self.wordlist.get_iwords(title, pos):
+                words.append(word)
+                for lemma in word.form_of:
+                    titles[lemma] = None
+                    words += self.wordlist.get_iwords(lemma, word.pos)
+
+        for title in titles:
+            lines = self.wordlist.all_entries.get(title, [])
+            if lines is None:
+                raise ValueError("Entry data is not available, page fingerprints require a wordlist backend that keeps entry data", title)
+            add(title, len(lines), *lines)
+
+        for word in words:
+            add(word.word, word.pos, *sorted(self.get_highlight_targets(word)))
+
+        return sha1.hexdigest()
+
+    def _add_worker_stats(self, entry, stats):
+        self.add_highlight_stats(stats)
+        return entry
+
+    def export(self, verbose=False, workers=None, state=None):
+        """ Yields the dictunformat lines
+
+        If workers is set, pages are rendered by that many forked processes. The
+        wordlist and allforms are shared with the workers and must not be modified
+        during the export, file based allforms should be opened with readonly=True
+
+        If state is an ExportState, pages rendered by a previous export with the same
+        fingerprint are reused and newly rendered pages are added to it """
 
         prev_form = None
         form_targets = []
@@ -456,18 +587,56 @@ class WordlistToDictunformat():
 
         yield f"##:pagecount:{len(all_pages)}\n##:formcount:{form_count}"
 
-        count = 0
-        for targets,keys in sorted(all_pages.items(), key=lambda x: self.get_primary_word(x[1])):
-            count += 1
-            if count % 1000 == 0 and verbose:
-                print(count, file=sys.stderr, end="\r")
-
-            primary = self.get_primary_word(keys)
+        # find the primary word of each page once, it's used for sorting and as the page title
+        pages = sorted(((self.get_primary_word(keys), targets, keys) for targets, keys in all_pages.items()), key=lambda x: x[0])
+        del all_pages
 
-            entry = self.build_entry(primary, targets)
+        if state:
+            fingerprints = [self.get_page_fingerprint(primary, targets) for primary, targets, keys in pages]
+            render = [fingerprint not in state for fingerprint in fingerprints]
+        else:
+            fingerprints = [None] * len(pages)
+            render = [True] * len(pages)
+        render_pages = ((primary, targets) for (primary, targets, keys), x in zip(pages, render) if x)
+
+        pool = None
+        if workers and workers > 1:
+            if self.wordlist.expansion_cache:
+                self.wordlist.expansion_cache.commit()
+            pool = multiprocessing.get_context("fork").Pool(workers, _init_worker, (self,))
+            # imap returns the entries in the same order as the pages
+            rendered = pool.imap(_build_entry, render_pages, 100)
+            rendered = (self._add_worker_stats(*res) for res in rendered)
+        else:
+            rendered = (self.build_entry(primary, targets) for primary, targets in render_pages)
 
-            yield "_____"
-            keys.remove(primary)
+        def iter_entries():
+            for fingerprint, x in zip(fingerprints, render):
+                if not x:
+                    yield state.get(fingerprint)
+                    continue
 
-            yield ";   ".join([primary] + sorted(keys))
-            yield entry
+                entry = next(rendered)
+                if state:
+                    state.store(fingerprint, entry)
+                yield entry
+
+        entries = iter_entries()
+
+        try:
+            count = 0
+            for (primary, targets, keys), entry in zip(pages, entries):
+                count += 1
+                if count % 1000 == 0 and verbose:
+                    print(count, file=sys.stderr, end="\r")
+
+                yield "_____"
+                keys.remove(primary)
+
+                yield ";   ".join([primary] + sorted(keys))
+                yield entry
+        finally:
+            # also stops the workers if the caller doesn't consume all of the lines
+            if pool:
+                pool.terminate()
+                pool.join()
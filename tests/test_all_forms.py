@@ -1,5 +1,11 @@
+import io
+import os
+import pytest
+import sqlite3
+
 from enwiktionary_wordlist.wordlist import Wordlist
-from enwiktionary_wordlist.all_forms import AllForms
+from enwiktionary_wordlist.all_forms import AllForms, MemoryAllForms
+from enwiktionary_wordlist.mmap_allforms import MmapAllForms
 
 import enwiktionary_templates
 
@@ -1451,3 +1457,284 @@ proscríbetelos,v,proscribir"""
 
 
 
+
+def test_memory_allforms():
+
+    wordlist_data = """\
+_____
+protector
+pos: n
+  meta: {{head|es|noun|plural|protectores|feminine|protectora|feminine plural|protectoras|g=m}}
+  g: m
+  gloss: protector
+pos: adj
+  meta: {{head|es|adjective|plural|protectores|feminine|protectora|feminine plural|protectoras}}
+  gloss: protective
+_____
+protectora
+pos: n
+  meta: {{head|es|noun|plural|protectoras|g=f}}
+  g: f
+  gloss: female equivalent of "protector"
+_____
+protectoras
+pos: n
+  meta: {{head|es|noun form|g=f-p}}
+  g: f-p
+  gloss: plural of "protectora"
+_____
+proteger
+pos: v
+  meta: {{head|es|verb}}
+  gloss: to protect
+_____
+protegerse
+pos: v
+  meta: {{head|es|verb}}
+  gloss: to protect oneself
+"""
+
+    wordlist = Wordlist(wordlist_data.splitlines())
+    sql = AllForms.from_wordlist(wordlist)
+    mem = MemoryAllForms.from_wordlist(wordlist)
+
+    assert list(mem.all) == list(sql.all)
+    assert list(mem.all_csv) == list(sql.all_csv)
+    assert list(mem.all_forms) == list(sql.all_forms)
+    assert list(mem.all_lemmas) == list(sql.all_lemmas)
+
+    words = list(sql.all_forms) + ["missing"]
+    for word in words:
+        assert list(mem.get_form_pos(word)) == list(sql.get_form_pos(word))
+        for pos in [None, "n", "adj", "v", ["n", "v"], "missing"]:
+            assert mem.get_lemmas(word, pos) == sql.get_lemmas(word, pos)
+            if not isinstance(pos, list):
+                # form order depends on the index SQLite picks for the query
+                assert sorted(mem.get_lemma_forms(word, pos)) == sorted(sql.get_lemma_forms(word, pos))
+                assert mem.has_form(word, pos) == sql.has_form(word, pos)
+                assert mem.has_lemma(word, pos) == sql.has_lemma(word, pos)
+
+    assert mem.get_lemma_forms("protector", "n") == ["protector", "protectora", "protectoras", "protectores"]
+
+    csv_data = list(sql.all_csv)
+    assert list(MemoryAllForms.from_data(csv_data).all_csv) == csv_data
+
+    # the memory backend doesn't have any of the SQLite state or options
+    assert not isinstance(mem, AllForms)
+    assert not hasattr(mem, "dbcon")
+    with pytest.raises(TypeError):
+        MemoryAllForms("allforms.sqlite")
+    with pytest.raises(TypeError):
+        MemoryAllForms.from_data(csv_data, "allforms.sqlite")
+
+def test_mmap_allforms(tmp_path, monkeypatch):
+
+    allforms_data = """\
+protector,adj,protector
+protector,n,protector
+protectora,adj,protector
+protectora,n,protector,protectora
+protectoras,adj,protector
+protectoras,n,protector,protectora
+protectores,adj,protector
+protectores,n,protector
+proteger,v,proteger,protegerse
+protegerse,v,protegerse
+""".splitlines()
+
+    sql = AllForms.from_data(allforms_data)
+
+    from_csv = str(tmp_path / "csv.idx")
+    MmapAllForms.from_csv(allforms_data, from_csv)
+    from_sql = str(tmp_path / "sql.idx")
+    MmapAllForms.from_allforms(sql, from_sql)
+
+    with open(from_csv, "rb") as a, open(from_sql, "rb") as b:
+        assert a.read() == b.read()
+
+    idx = MmapAllForms(from_csv)
+
+    assert list(idx.all) == list(sql.all)
+    assert list(idx.all_csv) == allforms_data
+    assert list(idx.all_forms) == list(sql.all_forms)
+    assert list(idx.all_lemmas) == list(sql.all_lemmas)
+
+    words = list(sql.all_forms) + ["missing", "n", ""]
+    for word in words:
+        assert sorted(idx.get_form_pos(word)) == sorted(sql.get_form_pos(word))
+        for pos in [None, "n", "adj", "v", ["n", "v"], "missing"]:
+            assert idx.get_lemmas(word, pos) == sql.get_lemmas(word, pos)
+            if not isinstance(pos, list):
+                assert sorted(idx.get_lemma_forms(word, pos)) == sorted(sql.get_lemma_forms(word, pos))
+                assert idx.has_form(word, pos) == sql.has_form(word, pos)
+                assert idx.has_lemma(word, pos) == sql.has_lemma(word, pos)
+
+    assert idx.get_lemmas("protectoras") == ["adj|protector", "n|protector", "n|protectora"]
+    assert idx.get_lemma_forms("protectora") == ["protectora", "protectoras"]
+    assert sorted(idx.get_all_forms("v")) == ["proteger", "protegerse"]
+
+    csvfile = tmp_path / "allforms.csv"
+    csvfile.write_text("\n".join(allforms_data))
+    assert list(MmapAllForms.from_file(str(csvfile)).all_csv) == allforms_data
+    assert MmapAllForms.is_index(str(csvfile) + ".idx")
+    assert list(MmapAllForms.from_file(str(csvfile) + ".idx").all_csv) == allforms_data
+
+    # the sidecar is reused while the CSV content is unchanged, even if the file was touched or copied
+    os.utime(csvfile, ns=(0, 0))
+    built = []
+    monkeypatch.setattr(MmapAllForms, "from_csv", lambda *args: built.append(args))
+    assert list(MmapAllForms.from_file(str(csvfile)).all_csv) == allforms_data
+    assert built == []
+    monkeypatch.undo()
+
+    # and rebuilt when it changes
+    csvfile.write_text("\n".join(allforms_data[:-1]))
+    assert list(MmapAllForms.from_file(str(csvfile)).all_csv) == allforms_data[:-1]
+
+    # indexes can't be built by the AllForms constructors
+    assert not hasattr(MmapAllForms, "from_wordlist")
+    assert not hasattr(MmapAllForms, "from_data")
+
+def test_get_many(tmp_path):
+
+    allforms_data = """\
+protector,adj,protector
+protector,n,protector
+protectora,adj,protector
+protectora,n,protector,protectora
+protectoras,adj,protector
+protectoras,n,protector,protectora
+protectores,adj,protector
+protectores,n,protector
+proteger,v,proteger,protegerse
+protegerse,v,protegerse
+""".splitlines()
+
+    sql = AllForms.from_data(allforms_data)
+    # force the queries to be split into several batches
+    sql.MAX_PARAMS = 3
+
+    mem = MemoryAllForms.from_data(allforms_data)
+    MmapAllForms.from_csv(allforms_data, str(tmp_path / "allforms.idx"))
+    idx = MmapAllForms(str(tmp_path / "allforms.idx"))
+
+    words = list(sql.all_forms) + ["missing", "protector"]
+    for allforms in [sql, mem, idx]:
+        for pos in [None, "n", "v", ["n", "adj"]]:
+            res = allforms.get_lemmas_many(words, pos)
+            assert list(res) == list(dict.fromkeys(words))
+            assert res == {word:sql.get_lemmas(word, pos) for word in words}
+
+            if not isinstance(pos, list):
+                res = allforms.get_lemma_forms_many(words, pos)
+                assert {k:sorted(v) for k,v in res.items()} == {word:sorted(sql.get_lemma_forms(word, pos)) for word in words}
+
+    assert sql.get_lemmas_many(["protectoras", "missing"]) == {"protectoras": ["adj|protector", "n|protector", "n|protectora"], "missing": []}
+    assert sql.get_lemmas_many([]) == {}
+
+def test_readonly(tmp_path):
+
+    allforms_data = """\
+protector,n,protector
+protectora,n,protector,protectora
+protectoras,n,protector,protectora
+protectores,n,protector
+""".splitlines()
+
+    csvfile = tmp_path / "allforms.csv"
+    csvfile.write_text("\n".join(allforms_data))
+
+    allforms = AllForms.from_file(str(csvfile), readonly=True)
+    assert allforms.readonly
+    assert list(allforms.all_csv) == allforms_data
+
+    # each thread gets its own connection
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        res = list(executor.map(allforms.get_lemmas, ["protectoras"]*20))
+        connections = set(executor.map(lambda x: id(allforms.dbcon), range(20)))
+    assert res == [["n|protector", "n|protectora"]]*20
+    assert id(allforms.dbcon) not in connections
+
+    # connections of finished threads are closed instead of accumulating
+    import gc
+    import threading
+    dbcons = []
+    for _ in range(50):
+        thread = threading.Thread(target=lambda: dbcons.append(allforms.dbcon))
+        thread.start()
+        thread.join()
+    gc.collect()
+    assert len(allforms._connections) < 10
+    with pytest.raises(sqlite3.ProgrammingError):
+        dbcons[0].execute("SELECT 1")
+    dbcons = []
+
+    with pytest.raises(sqlite3.OperationalError):
+        allforms.dbcon.execute("INSERT INTO forms VALUES ('a', 'n', 'a')")
+
+    allforms.close()
+
+    # reopening uses the existing cache
+    allforms = AllForms.from_file(str(csvfile), readonly=True)
+    assert allforms.get_lemma_forms("protectora") == ["protectora", "protectoras"]
+    allforms.close()
+
+    with pytest.raises(ValueError):
+        AllForms(str(tmp_path / "missing.sqlite"), readonly=True)
+
+def test_write_csv(tmp_path):
+
+    wordlist_data = """\
+_____
+protector
+pos: n
+  meta: {{head|es|noun|plural|protectores|feminine|protectora|feminine plural|protectoras|g=m}}
+  g: m
+  gloss: protector
+pos: adj
+  meta: {{head|es|adjective|plural|protectores|feminine|protectora|feminine plural|protectoras}}
+  gloss: protective
+_____
+protectora
+pos: n
+  meta: {{head|es|noun|plural|protectoras|g=f}}
+  g: f
+  gloss: female equivalent of "protector"
+_____
+protectoras
+pos: n
+  meta: {{head|es|noun form|g=f-p}}
+  g: f-p
+  gloss: plural of "protectora"
+_____
+protegerse
+pos: v
+  meta: {{head|es|verb}}
+  gloss: to protect oneself
+"""
+
+    wordlist = Wordlist(wordlist_data.splitlines())
+    allforms = AllForms.from_wordlist(wordlist)
+    expected = "".join(line + "\n" for line in allforms.all_csv)
+
+    outfile = io.StringIO()
+    allforms.write_csv(outfile)
+    assert outfile.getvalue() == expected
+
+    # forms of the same lemma are spread over several chunks
+    for chunk_size in [1, 2, 100]:
+        outfile = io.StringIO()
+        rows = AllForms.iter_wordlist_rows(wordlist, chunk_size, tmpdir=tmp_path)
+        AllForms.write_rows_csv(outfile, rows)
+        assert outfile.getvalue() == expected
+
+    assert list(tmp_path.iterdir()) == []
+
+    # output matches make_csv, including surrounding whitespace and empty allforms
+    rows = [(" padded ", "n", "lemma"), ("x", "n", "b"), ("x", "n", "a")]
+    assert list(AllForms.iter_rows_csv(rows)) == [AllForms.make_csv(" padded ", "n", ["lemma"]), AllForms.make_csv("x", "n", ["a", "b"])]
+    assert list(AllForms().all_csv) == [","]
+    outfile = io.StringIO()
+    AllForms().write_csv(outfile)
+    assert outfile.getvalue() == ",\n"
@@ -0,0 +1,69 @@
+from enwiktionary_wordlist.expansion_cache import ExpansionCache
+
+def test_expansion_cache(tmp_path):
+
+    calls = []
+    def expand(text, title):
+        calls.append((text, title))
+        if text == "{{es-noun|m}}":
+            return f"pl={title}s"
+        return "pl=explicit"
+
+    dbfile = str(tmp_path / "expansions.db")
+    cache = ExpansionCache(dbfile)
+
+    # title dependent expansions are only reused for the same title
+    assert cache.expand("{{es-noun|m}}", "amigo", expand) == "pl=amigos"
+    assert cache.expand("{{es-noun|m}}", "perro", expand) == "pl=perros"
+    assert cache.expand("{{es-noun|m}}", "amigo", expand) == "pl=amigos"
+    assert calls == [("{{es-noun|m}}", "amigo"), ("{{es-noun|m}}", "perro")]
+
+    # title independent expansions are reused for every title
+    calls.clear()
+    assert cache.expand("{{es-noun|m|pl=explicit}}", "amigo", expand) == "pl=explicit"
+    assert cache.expand("{{es-noun|m|pl=explicit}}", "perro", expand) == "pl=explicit"
+    assert calls == [("{{es-noun|m|pl=explicit}}", "amigo")] + [("{{es-noun|m|pl=explicit}}", p) for p in ExpansionCache.PROBE_TITLES]
+
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache.close()
+
+    # stored expansions are reused in later runs
+    calls.clear()
+    cache = ExpansionCache(dbfile)
+    assert cache.expand("{{es-noun|m}}", "perro", expand) == "pl=perros"
+    assert cache.expand("{{es-noun|m|pl=explicit}}", "gato", expand) == "pl=explicit"
+    assert calls == []
+    assert cache.hit_rate == 1
+
+def test_expansion_cache_memory():
+
+    calls = []
+    def expand(text, title):
+        calls.append((text, title))
+        return f"pl={title}s"
+
+    # without a database, title dependent expansions are still memoized per title
+    cache = ExpansionCache()
+    assert cache.expand("{{es-noun|m}}", "amigo", expand) == "pl=amigos"
+    assert cache.expand("{{es-noun|m}}", "perro", expand) == "pl=perros"
+    assert cache.expand("{{es-noun|m}}", "amigo", expand) == "pl=amigos"
+    assert cache.expand("{{es-noun|m}}", "perro", expand) == "pl=perros"
+    assert calls == [("{{es-noun|m}}", "amigo"), ("{{es-noun|m}}", "perro")]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_expansion_cache_stored_title(tmp_path):
+
+    dbfile = str(tmp_path / "expansions.db")
+    cache = ExpansionCache(dbfile)
+    cache._store("{{es-noun|m}}", "", "pl=generic")
+    cache._store("{{es-noun|m}}", "amigo", "pl=amigos")
+    cache.close()
+
+    # title specific expansions are used over ones stored for every title
+    def expand(text, title):
+        raise AssertionError("unexpected expansion")
+
+    cache = ExpansionCache(dbfile)
+    assert cache.expand("{{es-noun|m}}", "amigo", expand) == "pl=amigos"
+    assert ExpansionCache(dbfile).expand("{{es-noun|m}}", "perro", expand) == "pl=generic"
+
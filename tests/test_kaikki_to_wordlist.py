@@ -1,4 +1,8 @@
-from enwiktionary_wordlist.kaikki_to_wordlist import KaikkiToWordlist as cls
+import io
+import json
+import pytest
+
+from enwiktionary_wordlist.kaikki_to_wordlist import KaikkiToWordlist as cls, LemmaRuns
 
 def test_get_formtype():
     assert cls.get_formtype("plural of blah") == ('plural', 'blah')
@@ -6,3 +10,108 @@ def test_get_formtype():
     assert cls.get_formtype("infinitive of hablar combined with me") == ('infinitive combined with me', 'hablar')
     assert cls.get_formtype("Third-person singular simple present indicative form of dictionary") == ('Third-person singular simple present indicative', 'dictionary')
 
+
+def test_single_pass(tmp_path):
+
+    entries = [
+        # forms listed before their lemma can only be resolved at the end
+        {"word": "gatos", "pos": "noun", "senses": [{"glosses": ["plural of gato"], "raw_glosses": ["plural of gato"]}]},
+        {"word": "gatas", "pos": "noun", "senses": [{"glosses": ["plural of gata"], "raw_glosses": ["plural of gata"]}]},
+        {"word": "gato", "pos": "noun", "forms": [{"form": "gatos"}, {"form": "gata"}],
+            "head_templates": [{"expansion": "gato m (plural gatos)"}],
+            "senses": [{"glosses": ["cat"], "raw_glosses": ["cat"], "examples": [{"text": "un gato", "english": "a cat"}]}]},
+        {"word": "gata", "pos": "noun", "senses": [
+            {"glosses": ["female equivalent of gato"], "raw_glosses": ["female equivalent of gato"]},
+            {"glosses": ["jack (for lifting cars)"], "raw_glosses": ["jack (for lifting cars)"]}]},
+        {"word": "gato", "pos": "verb", "senses": [{"glosses": ["first-person singular present indicative of gatar"],
+            "raw_glosses": ["first-person singular present indicative of gatar"]}]},
+        {"word": "perros", "pos": "noun", "senses": [{"glosses": ["plural of perro"], "raw_glosses": ["plural of perro"]}]},
+        {"word": "perro", "pos": "noun", "forms": [{"form": "perros"}], "senses": [{"glosses": ["dog"], "raw_glosses": ["dog"]}]},
+        {"word": "nada", "pos": "noun", "senses": []},
+    ]
+
+    filename = tmp_path / "kaikki.jsonl"
+    filename.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    # self declared forms make "gatas" and "gato" (verb) known forms of "gata" and "gatar"
+    for include_self_declared, lemmas in [
+            (False, {"gatas": ["noun"], "gato": ["noun", "verb"], "gata": ["noun"], "perro": ["noun"]}),
+            (True, {"gato": ["noun"], "gata": ["noun"], "perro": ["noun"]})]:
+        one_pass = cls(str(filename), include_self_declared, single_pass=True)
+        two_pass = cls(str(filename), include_self_declared, single_pass=False)
+        parallel = cls(str(filename), include_self_declared, workers=3)
+
+        assert one_pass.all_forms == two_pass.all_forms == parallel.all_forms
+        assert one_pass.all_lemmas == two_pass.all_lemmas == parallel.all_lemmas
+        assert list(parallel.all_lemmas) == list(one_pass.all_lemmas)
+        assert {k:list(v) for k,v in one_pass.all_lemmas.items()} == lemmas
+
+def test_get_chunks(tmp_path):
+    filename = tmp_path / "kaikki.jsonl"
+    lines = [json.dumps({"word": "x"*i}) + "\n" for i in range(50)]
+    filename.write_text("".join(lines))
+    data = filename.read_bytes()
+
+    for chunk_size in [1, 10, 100, len(data)-1, len(data), len(data)*2]:
+        chunks = cls._get_chunks(str(filename), chunk_size)
+        assert chunks[0][0] == 0
+        assert chunks[-1][1] == len(data)
+        assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+        assert all(data[start-1:start] == b"\n" for start, end in chunks[1:])
+
+    # small chunks hold a single line, large ones the whole file
+    assert len(cls._get_chunks(str(filename), 1)) == len(lines)
+    assert cls._get_chunks(str(filename), len(data)) == [(0, len(data))]
+
+    # each chunk's lines are read up to the end of its range
+    with open(filename, "rb") as infile:
+        start, end = cls._get_chunks(str(filename), 100)[1]
+        infile.seek(start)
+        assert "".join(cls._iter_chunk_lines(infile, end)) == data[start:end].decode()
+
+def test_dump_wordlist_spill(tmp_path, monkeypatch):
+
+    entries = [
+        {"word": "gato", "pos": "noun", "forms": [{"form": "gatos"}],
+            "head_templates": [{"expansion": "gato m (plural gatos)"}], "etymology_text": "From Latin cattus",
+            "senses": [{"glosses": ["cat"], "raw_glosses": ["cat"], "synonyms": [{"word": "minino"}],
+                "examples": [{"text": "un gato\nnegro", "english": "a black cat", "ref": "Author"}, {"text": "el gato"}]}]},
+        {"word": "abeja", "pos": "noun", "senses": [{"glosses": ["bee"], "raw_glosses": ["bee"]}]},
+        {"word": "gato", "pos": "verb", "senses": [{"glosses": ["to crawl"], "raw_glosses": ["to crawl"]}]},
+        {"word": "zorro", "pos": "noun", "senses": [{"glosses": ["fox"], "raw_glosses": ["fox"]}]},
+        {"word": "gato", "pos": "noun", "senses": [{"glosses": ["jack"], "raw_glosses": ["jack"]}]},
+        {"word": "abeja", "pos": "adj", "senses": [{"glosses": ["bee-like"], "raw_glosses": ["bee-like"]}]},
+        {"word": "ñandú", "pos": "noun", "senses": [{"glosses": ["rhea"], "raw_glosses": ["rhea"]}]},
+    ]
+
+    filename = tmp_path / "kaikki.jsonl"
+    filename.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    outfile = io.StringIO()
+    cls(str(filename)).dump_wordlist(outfile)
+    expected = outfile.getvalue()
+    assert expected.startswith("_____\nabeja\npos: noun\n  gloss: bee\npos: adj\n")
+    assert "    ex: un gato\\nnegro\n      eng: a black cat\n      src: Author\n" in expected
+
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    # a fan-in of 2 merges the runs in several passes
+    for single_pass, merge_fanin in [(True, 64), (False, 64), (False, 2)]:
+        monkeypatch.setattr(LemmaRuns, "MERGE_FANIN", merge_fanin)
+        for spill_size in [1, 2, 100]:
+            converter = cls(str(filename), single_pass=single_pass, spill_size=spill_size, tmpdir=spill_dir)
+            outfile = io.StringIO()
+            converter.dump_wordlist(outfile)
+            assert outfile.getvalue() == expected
+            converter.close()
+            assert list(spill_dir.iterdir()) == []
+
+    # spilled loads always read the file twice, single pass loads keep every candidate lemma in memory
+    monkeypatch.setattr(cls, "load", None)
+    converter = cls(str(filename), single_pass=True, spill_size=2, tmpdir=spill_dir)
+    converter.close()
+
+    with pytest.raises(ValueError):
+        cls(str(filename), spill_size=2, workers=2)
+    with pytest.raises(ValueError):
+        cls(str(filename), single_pass=False, workers=2)
@@ -1,3 +1,7 @@
+import glob
+import os
+import re
+
 from enwiktionary_wordlist.sense import Sense
 
 def run_test_sense_form(gloss, formtype, lemma, nonform):
@@ -34,3 +38,52 @@ def test_sense():
     run_test_sense_form('inflection of "-acho"', "form", "-acho", "")
     run_test_sense_form('only used in "autogestionarse"', "onlyin", "autogestionarse", "")
 
+
+def reference_parse_form_of(definition):
+    """ Sense.parse_form_of as implemented with the uncompiled patterns """
+    res = re.search(Sense.form_pattern, definition)
+    if res:
+        formtype = Sense.form_of_prefix.get(res.group(1), res.group(1))
+        lemma = res.group(2)
+        nonform = re.sub(re.escape(res.group(0)), "", definition).strip()
+        if res.group(1) == "compound form":
+            nonform = re.sub(r'^([+]".*?")*', "", nonform)
+        return (formtype, lemma, nonform)
+
+    res = re.search(Sense.alt_form_pattern, definition)
+    if res:
+        formtype = Sense.form_of_prefix[res.group(1)]
+        lemma = res.group(2)
+        nonform = re.sub(re.escape(res.group(0)), "", definition).strip()
+        return (formtype, lemma, nonform)
+
+    return (None,None,None)
+
+def test_parse_form_of_matches_reference():
+
+    # every gloss in the test data
+    glosses = set()
+    for filename in glob.glob(os.path.join(os.path.dirname(__file__), "*.py")):
+        with open(filename) as infile:
+            for line in infile:
+                match = re.search(r"(?:gloss: |:: )(.*)", line)
+                if match:
+                    glosses.add(match.group(1))
+
+    # and every prefix in every position
+    for prefix in list(Sense.form_of_prefix) + ["gerund_1s", "pp_ms"]:
+        for start in ["", "A ", "An ", "(", ", ", "; ", ") ", "the "]:
+            for join in [' of "', " of ", ' in "', " in ", " "]:
+                glosses.add(f'{start}{prefix}{join}test" (word), other; stuff')
+                glosses.add(f'text, {start}{prefix}{join}test", and {prefix} of "more"')
+
+    for gloss in sorted(glosses):
+        try:
+            expected = reference_parse_form_of(gloss)
+        except KeyError:
+            expected = KeyError
+        try:
+            res = Sense.parse_form_of(gloss)
+        except KeyError:
+            res = KeyError
+        assert res == expected, gloss
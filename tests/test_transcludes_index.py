@@ -0,0 +1,87 @@
+import os
+
+from enwiktionary_wordlist.transcludes_index import TranscludesIndex
+
+def test_transcludes_index(tmp_path, monkeypatch):
+
+    lines = [
+        "gato:s1:es:a cat\n",
+        "perro:s1:es:a dog\n",
+        "perro:s2:es:a scoundrel: a bad person\n",
+        "año:s1:es:a year\n",
+        "gato:s1:es:a tomcat\n",
+    ]
+
+    filename = str(tmp_path / "transcludes.txt")
+    with open(filename, "w") as outfile:
+        outfile.writelines(lines)
+
+    expected = dict(TranscludesIndex.iter_transcludes(lines))
+    assert expected[("perro", "s2")] == "a scoundrel: a bad person"
+
+    index = TranscludesIndex.from_file(filename)
+    assert index.filename == filename + ".idx"
+    assert TranscludesIndex.is_index(index.filename)
+    assert not TranscludesIndex.is_index(filename)
+
+    # duplicate keys use the last value
+    assert len(index) == 4
+    assert dict(index) == expected
+    assert index[("gato", "s1")] == "a tomcat"
+    assert index.get(("año", "s1")) == "a year"
+
+    assert ("perro", "s3") not in index
+    assert index.get(("perro", "s3")) is None
+    assert "perro" not in index
+
+    # the sidecar index is reused until the transcludes file changes
+    mtime = os.path.getmtime(index.filename)
+    assert TranscludesIndex.from_file(filename).filename == index.filename
+    assert os.path.getmtime(index.filename) == mtime
+
+    # touched or copied files with the same content still use the sidecar
+    os.utime(filename, ns=(0, 0))
+    built = []
+    monkeypatch.setattr(TranscludesIndex, "write", lambda *args: built.append(args))
+    assert dict(TranscludesIndex.from_file(filename)) == expected
+    assert built == []
+    monkeypatch.undo()
+
+    # changed files are indexed again
+    with open(filename, "a") as outfile:
+        outfile.write("zorro:s1:es:a fox\n")
+    assert TranscludesIndex.from_file(filename)[("zorro", "s1")] == "a fox"
+
+    # indexes can be opened directly
+    assert len(TranscludesIndex.from_file(index.filename)) == 5
+
+    empty = str(tmp_path / "empty.idx")
+    TranscludesIndex.write(empty, [])
+    assert len(TranscludesIndex(empty)) == 0
+    assert ("gato", "s1") not in TranscludesIndex(empty)
+
+def test_transcludes_index_readonly(tmp_path, monkeypatch):
+
+    filename = str(tmp_path / "transcludes.txt")
+    with open(filename, "w") as outfile:
+        outfile.write("gato:s1:es:a cat\n")
+
+    # sidecars that can't be written are replaced by a temporary index
+    write = TranscludesIndex.write
+    def readonly_write(cls, filename, items, source=None):
+        if filename.endswith(".txt.idx"):
+            raise PermissionError(filename)
+        write(filename, items, source)
+    monkeypatch.setattr(TranscludesIndex, "write", classmethod(readonly_write))
+
+    index = TranscludesIndex.from_file(filename)
+    assert not os.path.exists(filename + ".idx")
+    assert os.path.exists(index.filename)
+    assert dict(index) == {("gato", "s1"): "a cat"}
+
+    # other processes can open the temporary index until it's closed
+    other = TranscludesIndex(index.filename)
+    assert dict(other) == dict(index)
+    other.close()
+    index.close()
+    assert not os.path.exists(index.filename)
@@ -1,4 +1,10 @@
+import mmap
+import pytest
+
 from enwiktionary_wordlist.wordlist import Wordlist
+from enwiktionary_wordlist.entry_cache import EntryCache
+from enwiktionary_wordlist.mmap_entries import MmapEntries
+from enwiktionary_wordlist.source_stamp import SourceStamp
 
 def test_simple():
     data="""\
@@ -135,6 +141,53 @@ pos: n
     assert len(words._cached) == 0
 
 
+def test_cache_size():
+    data="""\
+_____
+amiga
+pos: n
+  meta: {{es-noun|f|m=amigo}}
+  g: f
+  gloss: female equivalent of "amigo", friend
+_____
+amigo
+pos: n
+  meta: {{es-noun|m|f=amiga}}
+  g: m
+  gloss: friend
+_____
+amigue
+pos: n
+  meta: {{es-noun|gneut}}
+  g: gneut
+  gloss: friend
+"""
+
+    words = Wordlist(data.splitlines(), cache_size=2)
+
+    assert words.has_word("amigo", "n") == True
+    assert words.has_word("amiga", "n") == True
+    assert words.has_word("amigo", "n") == True
+    assert list(words._cached) == ["amiga", "amigo"]
+    assert (words.cache_hits, words.cache_misses, words.cache_evictions) == (1, 2, 0)
+
+    # least recently used entry is evicted
+    assert words.has_word("amigue", "n") == True
+    assert list(words._cached) == ["amigo", "amigue"]
+    assert (words.cache_hits, words.cache_misses, words.cache_evictions) == (1, 3, 1)
+
+    # evicted entries are parsed again from the source lines
+    assert words.get_words("amiga")[0].genders == "f"
+    assert list(words._cached) == ["amigue", "amiga"]
+    assert (words.cache_hits, words.cache_misses, words.cache_evictions) == (1, 4, 2)
+
+    # entries added as iterators can be parsed more than once
+    words.all_entries["amigo"] = map(str.lstrip, ["pos: n", "  gloss: friend"])
+    words._cached.clear()
+    assert words.has_word("amigo", "n") == True
+    words._cached.clear()
+    assert words.has_word("amigo", "n") == True
+
 def test_dios():
 
     data = """\
@@ -180,3 +233,156 @@ aquellos {pron} :: Those ones. (over there; implying some distance)
 #        print(sense.gloss)
     assert word.form_of == {'aquéllos': ['alt']}
     assert word.forms == {}
+
+def test_mmap(tmp_path):
+    data="""\
+_____
+amiga
+pos: n
+  meta: {{es-noun|f|m=amigo}}
+  g: f
+  gloss: female equivalent of "amigo", friend
+_____
+# comment
+empty
+_____
+amigo
+pos: n
+  meta: {{es-noun|m|f=amiga}}
+  # comment
+  g: m
+  gloss: friend
+_____
+abeja
+pos: n
+  gloss: bee
+"""
+
+    filename = tmp_path / "wordlist.txt"
+    filename.write_text(data)
+
+    wordlist = Wordlist(data.splitlines())
+    mmap_wordlist = Wordlist.from_file(str(filename), backend="mmap")
+
+    assert list(mmap_wordlist.all_entries.items()) == list(wordlist.all_entries.items())
+    assert list(mmap_wordlist.all_entries) == ["amiga", "amigo", "abeja"]
+    assert len(mmap_wordlist.all_entries) == 3
+
+    assert mmap_wordlist.has_entry("empty") == False
+    assert mmap_wordlist.has_word("test", "n") == False
+    assert mmap_wordlist.has_word("abeja", "n") == True
+    assert mmap_wordlist.has_word("amigo", "n") == True
+    assert mmap_wordlist.get_words("amiga")[0].senses[0].gloss == 'female equivalent of "amigo", friend'
+
+    # source lines are still available after the word has been cached
+    assert mmap_wordlist.all_entries["amigo"] == ['pos: n', 'meta: {{es-noun|m|f=amiga}}', 'g: m', 'gloss: friend']
+
+    # later loads map the saved offsets instead of scanning the file
+    assert mmap_wordlist.all_entries._index_mm is None
+    reloaded = Wordlist.from_file(str(filename), backend="mmap")
+    assert reloaded.all_entries._index_mm is not None
+    assert list(reloaded.all_entries.items()) == list(wordlist.all_entries.items())
+    assert reloaded.get_words("amiga")[0].senses[0].gloss == 'female equivalent of "amigo", friend'
+
+    # the index is rebuilt when the wordlist changes
+    changed = data.replace("bee", "wasp")
+    filename.write_text(changed)
+    reloaded = Wordlist.from_file(str(filename), backend="mmap")
+    assert reloaded.all_entries._index_mm is None
+    assert reloaded.all_entries["abeja"] == ["pos: n", "gloss: wasp"]
+
+    # separators may have surrounding whitespace, like the dict backend
+    spaced = changed.replace("_____\namigo", "  _____ \r\namigo")
+    filename.write_text(spaced)
+    reloaded = Wordlist.from_file(str(filename), backend="mmap")
+    assert list(reloaded.all_entries.items()) == list(Wordlist(spaced.splitlines()).all_entries.items())
+    assert list(reloaded.all_entries) == ["amiga", "amigo", "abeja"]
+
+def test_entry_cache(tmp_path, monkeypatch):
+    data="""\
+_____
+amiga
+pos: n
+  meta: {{es-noun|f|m=amigo}}
+  g: f
+  gloss: female equivalent of "amigo", friend
+_____
+amigo
+pos: n
+  meta: {{es-noun|m|f=amiga}}
+  g: m
+  gloss: friend
+"""
+
+    filename = tmp_path / "wordlist.txt"
+    filename.write_text(data)
+    cached = tmp_path / "wordlist.txt.~db"
+
+    # first load builds the cache
+    wordlist = Wordlist.from_file(str(filename))
+    assert isinstance(wordlist.all_entries, dict)
+    assert cached.exists()
+
+    # second load reads from the cache
+    wordlist = Wordlist.from_file(str(filename))
+    assert isinstance(wordlist.all_entries, EntryCache)
+    assert list(wordlist.all_entries.items()) == list(Wordlist(data.splitlines()).all_entries.items())
+    assert wordlist.has_word("amigo", "n") == True
+    assert wordlist.has_word("test", "n") == False
+    assert wordlist.get_words("amiga")[0].senses[0].gloss == 'female equivalent of "amigo", friend'
+
+    # copied files with the same content are still valid
+    copied = tmp_path / "copy.txt"
+    copied.write_text(data)
+    assert EntryCache.open(str(cached), str(copied)) is not None
+
+    # the stored mtime is updated after the content matched, so it isn't hashed again
+    hashed = []
+    monkeypatch.setattr(SourceStamp, "hash_file", lambda filename: hashed.append(filename))
+    assert EntryCache.open(str(cached), str(copied)) is not None
+    assert hashed == []
+    monkeypatch.undo()
+
+    # changed files are not
+    copied.write_text(data.replace("friend", "fiend"))
+    assert EntryCache.open(str(cached), str(copied)) is None
+
+    # caches in an unknown format are rebuilt
+    cached.write_bytes(b"garbage" * 20)
+    assert EntryCache.open(str(cached), str(filename)) is None
+    wordlist = Wordlist.from_file(str(filename))
+    assert isinstance(wordlist.all_entries, dict)
+    assert EntryCache.open(str(cached), str(filename)) is not None
+
+def test_mmap_workers(tmp_path):
+    entries = []
+    for i in range(200):
+        sep = "  _____ " if i % 7 == 3 else "_____"
+        entries.append(f"{sep}\nword{i%150}\npos: n\n  g: m\n  gloss: gloss {i} _____\n")
+    data = "".join(entries)
+
+    filename = tmp_path / "wordlist.txt"
+    filename.write_text(data)
+
+    with open(filename, "rb") as infile:
+        mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    chunks = MmapEntries._get_chunks(mm, 16)
+    assert len(chunks) == 16
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(data)
+    assert all(a[1] == b[0] for a,b in zip(chunks, chunks[1:]))
+    assert all(mm[start:end].lstrip().startswith(b"_____") for start, end in chunks)
+    mm.close()
+
+    serial = MmapEntries(str(filename), use_index=False)
+    parallel = MmapEntries(str(filename), use_index=False, workers=4)
+    assert list(parallel.items()) == list(serial.items())
+    assert list(parallel._sorted) == list(serial._sorted)
+    assert list(parallel.items()) == list(Wordlist(data.splitlines()).all_entries.items())
+
+    wordlist = Wordlist.from_file(str(filename), backend="mmap", workers=4)
+    assert wordlist.get_words("word10")[0].senses[0].gloss == "gloss 160 _____"
+
+    with pytest.raises(ValueError):
+        Wordlist.from_file(str(filename), workers=4)
+
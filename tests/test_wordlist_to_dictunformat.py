@@ -1,5 +1,6 @@
 from enwiktionary_wordlist.wordlist import Wordlist
 from enwiktionary_wordlist.wordlist_to_dictunformat import WordlistToDictunformat
+from enwiktionary_wordlist.export_state import ExportState
 
 import enwiktionary_templates
 
@@ -184,3 +185,149 @@ test;   tests
     res = "\n".join(exporter.export())
     assert res == expected
 
+
+
+def test_highlight_cache():
+
+    data = """\
+_____
+protector
+pos: n
+  meta: {{head|es|noun|plural|protectores|feminine|protectora|feminine plural|protectoras|g=m}}
+  g: m
+  gloss: protector
+    ex: Los protectores llegaron.
+    eng: The protectors arrived.
+  gloss: guardian
+    ex: Es un Protector.
+pos: adj
+  meta: {{head|es|adjective|plural|protectores|feminine|protectora|feminine plural|protectoras}}
+  gloss: protective
+    ex: una capa protectora
+"""
+
+    wordlist = Wordlist(data.splitlines())
+    exporter = WordlistToDictunformat(wordlist)
+    res = "\n".join(exporter.export())
+
+    assert "<i>Los <b>protectores</b> llegaron.</i>" in res
+    assert "<i>Es un <b>Protector</b>.</i>" in res
+    assert "<i>una capa <b>protectora</b></i>" in res
+    assert exporter.highlight_cache_misses == 2
+    assert exporter.highlight_cache_hits == 1
+
+    # patterns are rebuilt when the cache is full
+    exporter = WordlistToDictunformat(wordlist)
+    exporter.HIGHLIGHT_CACHE_SIZE = 1
+    assert "\n".join(exporter.export()) == res
+    assert len(exporter._highlight_patterns) == 1
+
+
+def test_export_workers():
+
+    data = """\
+_____
+protector
+pos: n
+  meta: {{head|es|noun|plural|protectores|feminine|protectora|feminine plural|protectoras|g=m}}
+  g: m
+  gloss: protector
+    ex: Los protectores llegaron.
+_____
+protectora
+pos: n
+  meta: {{head|es|noun|plural|protectoras|g=f}}
+  g: f
+  gloss: female equivalent of "protector"
+_____
+proteger
+pos: v
+  meta: {{head|es|verb}}
+  gloss: to protect
+_____
+protegerse
+pos: v
+  meta: {{head|es|verb}}
+  gloss: to protect oneself
+_____
+test
+pos: n
+  meta: {{head|es|noun|plural|tests}}
+  gloss: test
+"""
+
+    wordlist = Wordlist(data.splitlines())
+    converter = WordlistToDictunformat(wordlist)
+    expected = list(converter.export())
+    assert len(expected) > 10
+    lookups = converter.highlight_cache_hits + converter.highlight_cache_misses
+    assert lookups > 0
+
+    # the highlight counters of the workers are added to the parent's counters
+    wordlist = Wordlist(data.splitlines())
+    converter = WordlistToDictunformat(wordlist)
+    assert list(converter.export(workers=2)) == expected
+    assert converter.highlight_cache_hits + converter.highlight_cache_misses == lookups
+
+
+def test_export_incremental(tmp_path):
+
+    data = """\
+_____
+protector
+pos: n
+  meta: {{head|es|noun|plural|protectores|feminine|protectora|feminine plural|protectoras|g=m}}
+  g: m
+  gloss: protector
+    ex: Los protectores llegaron.
+_____
+protectora
+pos: n
+  meta: {{head|es|noun|plural|protectoras|g=f}}
+  g: f
+  gloss: female equivalent of "protector"
+_____
+test
+pos: n
+  meta: {{head|es|noun|plural|tests}}
+  gloss: test
+"""
+
+    def export(data, workers=None):
+        wordlist_file = tmp_path / "wordlist.txt"
+        wordlist_file.write_text(data)
+        wordlist = Wordlist.from_file(str(wordlist_file), backend="mmap")
+
+        state = ExportState(str(tmp_path / "state.db"))
+        converter = WordlistToDictunformat(wordlist)
+        res = list(converter.export(workers=workers, state=state))
+        state.close()
+        return res, state, converter
+
+    expected, state, converter = export(data)
+    assert expected.count("_____") == 2
+    assert state.reused == 0
+    assert state.rendered == 2
+    assert expected == list(WordlistToDictunformat(Wordlist(data.splitlines())).export())
+
+    res, state, converter = export(data)
+    assert res == expected
+    assert state.reused == 2
+    assert state.rendered == 0
+
+    # reused pages don't build highlight patterns
+    assert (converter.highlight_cache_hits, converter.highlight_cache_misses) == (0, 0)
+
+    # only the changed page is rendered again
+    changed = data.replace("gloss: test", "gloss: exam")
+    res, state, converter = export(changed, workers=2)
+    assert res == list(WordlistToDictunformat(Wordlist(changed.splitlines())).export())
+    assert res != expected
+    assert state.reused == 1
+    assert state.rendered == 1
+
+    # pages that weren't used by the last export are removed
+    res, state, converter = export(data)
+    assert res == expected
+    assert state.reused == 1
+    assert state.rendered == 1